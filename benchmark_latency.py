@@ -0,0 +1,236 @@
+"""
+Input-to-output latency benchmark for the DualSense Mapper
+----------------------------------------------------------
+Injects synthetic joystick events into pygame's event queue, and synthetic
+DualSense touch reports into a native report reader, while the real
+controller loop runs. Each injection is timed until the matching output
+reaches the output layer. Runs headless with a recording output backend, so no
+controller, display or keyboard/mouse output is needed.
+
+Usage:
+    python benchmark_latency.py [--iterations 200] [--tick-rate 60] [--mouse-rate 250] [--json results.json]
+"""
+
+import os
+
+# Headless SDL drivers must be selected before pygame is imported
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import argparse
+import json
+import random
+import struct
+import sys
+import threading
+import time
+from collections import deque
+
+import pygame
+
+import dualsense_mapper_optimized as mapper
+
+class BenchmarkBackend(mapper.RecordingBackend):
+    """Recording backend that signals the benchmark when the expected output arrives"""
+
+    def __init__(self):
+        super().__init__()
+        self.expected = None
+        self.arrival_time = 0.0
+        self.arrived = threading.Event()
+
+    def expect(self, match):
+        self.arrived.clear()
+        self.arrival_time = 0.0
+        self.expected = match
+
+    def emit_batch(self, events):
+        now = time.perf_counter()
+        match = self.expected
+        if match is None:
+            return
+        for event in events:
+            if match(event):
+                self.expected = None
+                self.arrival_time = now
+                self.arrived.set()
+                return
+
+def joystick_event(event_type, **attributes):
+    return pygame.event.Event(event_type, instance_id=0, joy=0, **attributes)
+
+class TouchReader(mapper.HidReader):
+    """Report reader without a device; the benchmark writes its reports directly"""
+
+    def __init__(self):
+        super().__init__(None, TOUCH_INSTANCE_ID, "Benchmark touchpad", None, deque(), lambda reader: None)
+        self.started = time.perf_counter()
+
+    def touch(self, x=None, y=None):
+        """Parses a USB report with one finger at (x, y), or none when x is None"""
+        buffer = self.buffer
+        buffer[:mapper.HID_USB_REPORT_SIZE] = bytes(mapper.HID_USB_REPORT_SIZE)
+        buffer[0] = mapper.HID_USB_REPORT_ID
+        payload = 1
+        buffer[payload:payload + 4] = b'\x80\x80\x80\x80'
+        buffer[payload + mapper.HID_BUTTONS] = 0x08
+        timestamp = int((time.perf_counter() - self.started) * mapper.HID_TIMESTAMP_RATE) & 0xFFFFFFFF
+        struct.pack_into('<I', buffer, payload + mapper.HID_MOTION_OFFSET + 12, timestamp)
+        touch = payload + mapper.HID_TOUCH_OFFSET
+        buffer[touch] = buffer[touch + 4] = 0x80
+        if x is not None:
+            buffer[touch:touch + 4] = bytes((1, x & 0xFF, (x >> 8) | (y & 0x0F) << 4, y >> 4))
+        self.parse(mapper.HID_USB_REPORT_SIZE)
+
+TOUCH_INSTANCE_ID = 1
+touch_reader = TouchReader()
+
+def touch(x=None, y=None):
+    return lambda: touch_reader.touch(x, y)
+
+def output_is(kind, *args):
+    """Matches an output event by kind and, optionally, its arguments"""
+    return lambda event: event[0] == kind and (not args or event[1:] == args)
+
+# Each scenario is a list of steps: (events to inject or a function that injects, matcher for the output to time, or None)
+SCENARIOS = {
+    'button_press': [
+        ([joystick_event(pygame.JOYBUTTONDOWN, button=mapper.BUTTON_INDEX['cross'])], output_is('key_down', '3')),
+        ([joystick_event(pygame.JOYBUTTONUP, button=mapper.BUTTON_INDEX['cross'])], None)
+    ],
+    'stick_to_wasd': [
+        ([joystick_event(pygame.JOYAXISMOTION, axis=mapper.AXIS_INDEX['left_y'], value=-0.9)], output_is('key_down', 'w')),
+        ([joystick_event(pygame.JOYAXISMOTION, axis=mapper.AXIS_INDEX['left_y'], value=0.0)], output_is('key_up', 'w'))
+    ],
+    'mouse_motion': [
+        ([joystick_event(pygame.JOYAXISMOTION, axis=mapper.AXIS_INDEX['right_x'], value=0.9)], output_is('move')),
+        ([joystick_event(pygame.JOYAXISMOTION, axis=mapper.AXIS_INDEX['right_x'], value=0.0)], None)
+    ],
+    'touchpad': [
+        (touch(900, 500), None),
+        (touch(1100, 520), output_is('move')),
+        (touch(), None)
+    ]
+}
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+def summarize(latencies, missed):
+    samples = sorted(latencies)
+    return {
+        'samples': len(samples),
+        'missed': missed,
+        'p50_ms': percentile(samples, 0.50) * 1000,
+        'p95_ms': percentile(samples, 0.95) * 1000,
+        'p99_ms': percentile(samples, 0.99) * 1000,
+        'max_ms': samples[-1] * 1000 if samples else 0.0
+    }
+
+def run_controller_loop(stop):
+    """The controller loop body from handle_controller, without device discovery"""
+    mapper.tick_scheduler.start()
+    while not stop.is_set():
+        mapper.wait_for_tick()
+        mapper.run_tick()
+    mapper.tick_scheduler.stop()
+
+def run_scenario(backend, steps, iterations, tick_period):
+    latencies = []
+    missed = 0
+    for i in range(iterations):
+        for events, match in steps:
+            # Land injections at random points within a tick
+            time.sleep(random.uniform(0, tick_period))
+            backend.expect(match)
+            injected = time.perf_counter()
+            if callable(events):
+                events()
+            else:
+                for event in events:
+                    pygame.event.post(event)
+            if match is None:
+                time.sleep(tick_period * 2)
+            elif backend.arrived.wait(timeout=1.0):
+                latencies.append(backend.arrival_time - injected)
+            else:
+                backend.expect(None)
+                missed += 1
+    return summarize(latencies, missed)
+
+def run_benchmark(iterations, tick_rate, mouse_rate, scenarios=None):
+    mapper.init_pygame()
+
+    backend = BenchmarkBackend()
+    backend.start()
+    mapper.output_backend = backend
+    # Trackpad mode without flicks, so a glide never stands in for the next expected motion
+    mapper.active_profile = mapper.compile_profile(dict(mapper.DEFAULT_PROFILE, touchpad={'flick': False}))
+    mapper.tick_scheduler = mapper.TickScheduler(tick_rate)
+
+    emitter = mapper.MouseEmitter(backend, mouse_rate)
+    mapper.mouse_emitter = emitter
+    emitter.start()
+    # Stands in for a connected controller; the injected events carry its instance id
+    mapper.register_device(0, "Benchmark controller")
+    mapper.register_device(TOUCH_INSTANCE_ID, touch_reader.name, reader=touch_reader)
+
+    stop = threading.Event()
+    loop = threading.Thread(target=run_controller_loop, args=(stop,), daemon=True)
+    loop.start()
+
+    results = {'tick_rate': tick_rate, 'mouse_rate': mouse_rate, 'iterations': iterations, 'scenarios': {}}
+    try:
+        for name in scenarios or SCENARIOS:
+            results['scenarios'][name] = run_scenario(backend, SCENARIOS[name], iterations, 1.0 / tick_rate)
+    finally:
+        stop.set()
+        loop.join(timeout=1)
+        emitter.stop()
+        backend.stop()
+
+    results['tick_jitter'] = mapper.tick_scheduler.get_jitter_stats()
+    results['mouse_jitter'] = emitter.scheduler.get_jitter_stats()
+    results['output_queue_wait_p99_ms'] = mapper.output_queue_wait.quantile(0.99) * 1000
+    emit_time = mapper.mouse_emit_time
+    results['mouse_emit_mean_us'] = emit_time.sum / emit_time.count * 1e6 if emit_time.count else 0.0
+    return results
+
+def print_results(results):
+    print(f"Tick rate {results['tick_rate']} Hz, mouse emit rate {results['mouse_rate']} Hz, "
+          f"{results['iterations']} iterations per scenario")
+    print(f"{'scenario':<16}{'samples':>8}{'missed':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, stats in results['scenarios'].items():
+        print(f"{name:<16}{stats['samples']:>8}{stats['missed']:>8}{stats['p50_ms']:>10.3f}"
+              f"{stats['p95_ms']:>10.3f}{stats['p99_ms']:>10.3f}{stats['max_ms']:>10.3f}")
+    for label, key in (("Tick jitter", 'tick_jitter'), ("Mouse emit jitter", 'mouse_jitter')):
+        jitter = results[key]
+        print(f"{label}: mean {jitter['mean_ms']:.3f} ms, p99 {jitter['p99_ms']:.3f} ms, "
+              f"max {jitter['max_ms']:.3f} ms, overruns {jitter['overruns']}")
+    print(f"Output queue wait: p99 <= {results['output_queue_wait_p99_ms']:g} ms")
+    print(f"Mouse emitter update (sticks, gyro and touchpad): mean {results['mouse_emit_mean_us']:.1f} us")
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure input-to-output latency of the DualSense mapper")
+    parser.add_argument('--iterations', type=int, default=200, help="injections per scenario (default: 200)")
+    parser.add_argument('--tick-rate', type=int, default=mapper.TICK_RATE, choices=mapper.SUPPORTED_TICK_RATES,
+                        help="controller loop rate in Hz")
+    parser.add_argument('--mouse-rate', type=int, default=mapper.MOUSE_EMIT_RATE, help="mouse emit rate in Hz")
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help="run only this scenario (repeatable)")
+    parser.add_argument('--json', metavar='PATH', help="also write the results as JSON")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.iterations, args.tick_rate, args.mouse_rate, args.scenario)
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    pygame.quit()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+Startup benchmark for the DualSense Mapper
+------------------------------------------
+Measures cold start for each SDL init mode: the time from launching a fresh
+Python process until the controller loop can read its first input, and the
+resident memory (RSS) at that point. Each run starts a new process, so
+import and SDL startup costs are included just as for a user launching the
+program.
+
+Usage:
+    python benchmark_startup.py [--runs 10] [--json results.json]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+MODES = ('full', 'selective')
+
+def get_rss_mb():
+    """Returns the resident set size of this process in MB"""
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [
+                ('cb', wintypes.DWORD),
+                ('PageFaultCount', wintypes.DWORD),
+                ('PeakWorkingSetSize', ctypes.c_size_t),
+                ('WorkingSetSize', ctypes.c_size_t),
+                ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                ('PagefileUsage', ctypes.c_size_t),
+                ('PeakPagefileUsage', ctypes.c_size_t)
+            ]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(),
+                                                 ctypes.byref(counters), counters.cb)
+        return counters.WorkingSetSize / (1024 * 1024)
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run_child(mode, launched):
+    """Starts the mapper the way handle_controller does and reports when the first poll completes"""
+    import dualsense_mapper_optimized as mapper
+    import pygame
+
+    mapper.init_pygame(mode)
+    for index in range(pygame.joystick.get_count()):
+        pygame.joystick.Joystick(index).init()
+    pygame.event.get()
+    ready = time.time()
+
+    print(json.dumps({'mode': mode, 'first_input_ms': (ready - launched) * 1000, 'rss_mb': get_rss_mb()}))
+    pygame.quit()
+
+def measure(mode):
+    launched = time.time()
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', mode, str(launched)],
+                            capture_output=True, text=True, check=True)
+    # Anything else the mapper prints is skipped; the measurement is the JSON line
+    return json.loads(next(line for line in reversed(result.stdout.splitlines()) if line.startswith('{')))
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure time-to-first-input and RSS for each SDL init mode")
+    parser.add_argument('--runs', type=int, default=10, help="launches per mode (default: 10)")
+    parser.add_argument('--json', metavar='PATH', help="also write the results as JSON")
+    parser.add_argument('--child', nargs=2, metavar=('MODE', 'LAUNCHED'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], float(args.child[1]))
+        return 0
+
+    # One warm-up launch so the first measured run doesn't pay for a cold disk cache
+    measure(MODES[0])
+
+    results = {}
+    for run in range(args.runs):
+        # Alternate modes so background noise affects both equally
+        for mode in MODES:
+            results.setdefault(mode, []).append(measure(mode))
+
+    summary = {}
+    print(f"{'mode':<12}{'first input ms (median)':>26}{'min':>10}{'max':>10}{'RSS MB (median)':>18}")
+    for mode in MODES:
+        times = [sample['first_input_ms'] for sample in results[mode]]
+        rss = [sample['rss_mb'] for sample in results[mode]]
+        summary[mode] = {'first_input_ms': median(times), 'first_input_min_ms': min(times),
+                         'first_input_max_ms': max(times), 'rss_mb': median(rss)}
+        print(f"{mode:<12}{median(times):>26.1f}{min(times):>10.1f}{max(times):>10.1f}{median(rss):>18.1f}")
+
+    full = summary['full']
+    selective = summary['selective']
+    print(f"Selective init saves {full['first_input_ms'] - selective['first_input_ms']:.1f} ms "
+          f"and {full['rss_mb'] - selective['rss_mb']:.1f} MB RSS")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'runs': args.runs, 'summary': summary, 'samples': results}, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
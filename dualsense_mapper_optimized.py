@@ -1,24 +1,168 @@
+import os
+
+# Keep pygame from printing its banner on import
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
 import pygame
-import pyautogui
 import time
-from threading import Thread
+from threading import Thread, Lock, Condition, Event, current_thread, get_ident
+from collections import deque
 import sys
-import os
-import tkinter as tk
-from tkinter import ttk, messagebox
-from PIL import Image, ImageTk
-import webbrowser
 import io
 import base64
+import hashlib
+import json
+import struct
+import argparse
+import atexit
+import math
+import select
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+
+try:
+    import tomllib
+except ImportError:
+    tomllib = None
+
+# Logging settings
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LOG_LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+LOG_LEVEL = INFO
+LOG_CAPACITY = 1000  # Entries kept in memory for the debug window
+LOG_PENDING_CAPACITY = 10000  # Entries waiting for the writer thread before the oldest are dropped
+LOG_FLUSH_INTERVAL = 0.2  # Seconds between writer thread batches
+LOG_FILE = None  # Log file path, None for the per-user log directory
+LOG_MAX_BYTES = 1 << 20  # Size at which the log file is rotated
+LOG_BACKUPS = 3  # Rotated log files kept
+
+def get_log_dir():
+    """Returns the per-user directory for the log file"""
+    if sys.platform == "win32":
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser("~")
+        return os.path.join(base, "DualSenseMapper", "logs")
+    if sys.platform == "darwin":
+        return os.path.expanduser("~/Library/Logs/DualSenseMapper")
+    base = os.environ.get('XDG_STATE_HOME') or os.path.expanduser("~/.local/state")
+    return os.path.join(base, "dualsense-mapper")
+
+class RingLogger:
+    """Fixed-capacity in-memory log. Logging only appends the unformatted entry;
+    a background thread formats batches and writes them to the console and a rotating file."""
+
+    def __init__(self, capacity=LOG_CAPACITY, level=LOG_LEVEL):
+        self.level = level
+        # deque appends and pops are atomic, so no thread ever takes a lock to log
+        self.entries = deque(maxlen=capacity)
+        self.pending = deque(maxlen=LOG_PENDING_CAPACITY)
+        self.wakeup = Event()
+        self.path = None
+        self.file = None
+        self.console = False
+        self.thread = None
+        self.running = False
+
+    def log(self, level, message, *args):
+        """Records a message; %-style args are only formatted when the entry is written or read"""
+        if level < self.level:
+            return
+        entry = (time.time(), level, message, args)
+        self.entries.append(entry)
+        self.pending.append(entry)
+        if level >= ERROR:
+            self.wakeup.set()
+
+    @staticmethod
+    def format(entry):
+        timestamp, level, message, args = entry
+        if args:
+            try:
+                message = message % args
+            except (TypeError, ValueError):
+                message = f"{message} {args}"
+        return f"{time.strftime('%H:%M:%S', time.localtime(timestamp))} {LOG_LEVEL_NAMES.get(level, level)}: {message}"
+
+    def recent(self, count=None):
+        """Returns the newest formatted entries from the ring, oldest first"""
+        entries = list(self.entries)
+        if count:
+            entries = entries[-count:]
+        return [self.format(entry) for entry in entries]
+
+    def start(self, path=None):
+        """Starts the writer thread; console output is skipped when there is no console (--noconsole builds)"""
+        if self.thread and self.thread.is_alive():
+            return
+        self.console = sys.stdout is not None
+        self.path = path or os.path.join(get_log_dir(), "dualsense_mapper.log")
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self.file = open(self.path, 'a', encoding='utf-8')
+        except OSError as e:
+            self.file = None
+            self.log(WARNING, "Could not open log file %s: %s", self.path, e)
+        self.running = True
+        self.thread = Thread(target=self.run, name="LogWriter", daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def run(self):
+        while self.running:
+            self.wakeup.wait(LOG_FLUSH_INTERVAL)
+            self.wakeup.clear()
+            self.write_pending()
+        self.write_pending()
+
+    def write_pending(self):
+        lines = []
+        while True:
+            try:
+                lines.append(self.format(self.pending.popleft()))
+            except IndexError:
+                break
+        if not lines:
+            return
+        text = "\n".join(lines) + "\n"
+        if self.console:
+            try:
+                sys.stdout.write(text)
+                sys.stdout.flush()
+            except (OSError, ValueError, AttributeError):
+                self.console = False
+        if self.file:
+            try:
+                self.file.write(text)
+                self.file.flush()
+                if self.file.tell() > LOG_MAX_BYTES:
+                    self.rotate()
+            except OSError:
+                self.file = None
+
+    def rotate(self):
+        """Moves log -> log.1 -> log.2 ... keeping LOG_BACKUPS old files"""
+        self.file.close()
+        for index in range(LOG_BACKUPS - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{index}"):
+                os.replace(f"{self.path}.{index}", f"{self.path}.{index + 1}")
+        os.replace(self.path, f"{self.path}.1")
+        self.file = open(self.path, 'a', encoding='utf-8')
 
-# Initializing debug logs
-debug_log = []
-def add_log(message):
-    global debug_log
-    debug_log.append(f"{time.strftime('%H:%M:%S')}: {message}")
-    print(f"DEBUG: {message}")
-    if len(debug_log) > 100:
-        debug_log = debug_log[-100:]
+    def stop(self):
+        """Writes everything still pending and stops the writer thread"""
+        self.running = False
+        self.wakeup.set()
+        if self.thread and self.thread is not current_thread():
+            self.thread.join(timeout=1)
+        if self.file:
+            self.file.close()
+            self.file = None
+
+logger = RingLogger()
+
+def add_log(message, *args, level=INFO):
+    """Logs a message through the ring logger without blocking"""
+    logger.log(level, message, *args)
 
 # Load the base64 image from file
 def load_base64_image():
@@ -43,34 +187,97 @@ def load_base64_image():
         add_log("Base64 image file not found in any location")
         return None
     except Exception as e:
-        add_log(f"Error loading base64 from file: {e}")
+        add_log(f"Error loading base64 from file: {e}", level=ERROR)
         return None
 
-# DualSense image embedded as base64
-DUALSENSE_IMAGE_BASE64 = load_base64_image()
-
 # Function to get the image from embedded data
-def get_embedded_image():
+def get_embedded_image(source):
     """Returns the DualSense image from embedded base64 data"""
+    from PIL import Image
     try:
-        if not DUALSENSE_IMAGE_BASE64:
+        if not source:
             add_log("No embedded image data available")
             return load_image_from_file()
             
         # Decode base64 to bytes
-        image_data = base64.b64decode(DUALSENSE_IMAGE_BASE64)
+        image_data = base64.b64decode(source)
         # Create an image object from bytes
         image = Image.open(io.BytesIO(image_data))
         add_log("Successfully loaded embedded image")
         return image
     except Exception as e:
-        add_log(f"Error loading embedded image: {e}")
+        add_log(f"Error loading embedded image: {e}", level=ERROR)
         # Fall back to file-based loading if embedded fails
         return load_image_from_file()
 
+def get_image_cache_dir():
+    """Returns the per-user cache directory for the resized controller image"""
+    if sys.platform == "win32":
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser("~")
+        return os.path.join(base, "DualSenseMapper", "cache")
+    if sys.platform == "darwin":
+        return os.path.expanduser("~/Library/Caches/DualSenseMapper")
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser("~/.cache")
+    return os.path.join(base, "dualsense-mapper")
+
+def save_cached_image(image, cache_path):
+    """Writes the resized image to the cache and removes entries for older sources"""
+    try:
+        cache_dir = os.path.dirname(cache_path)
+        os.makedirs(cache_dir, exist_ok=True)
+        suffix = cache_path[cache_path.rindex('_'):]
+        for name in os.listdir(cache_dir):
+            if name.startswith("controller_") and name.endswith(suffix):
+                os.remove(os.path.join(cache_dir, name))
+        temp_path = cache_path + ".tmp"
+        image.save(temp_path, "PNG")
+        os.replace(temp_path, cache_path)
+        add_log(f"Cached resized controller image at {cache_path}")
+    except OSError as e:
+        add_log(f"Could not cache controller image: {e}")
+
+def load_controller_photo(width):
+    """Returns the controller image resized to width as a Tk photo, from the cache when possible"""
+    import tkinter as tk
+    
+    # The cache is keyed by a hash of the image source and the target width
+    source = load_base64_image()
+    try:
+        if source:
+            source_bytes = source.encode('ascii')
+        else:
+            with open(resource_path("Dualsense-PS5.png"), 'rb') as f:
+                source_bytes = f.read()
+    except OSError as e:
+        add_log(f"Error reading controller image: {e}", level=ERROR)
+        return None
+    digest = hashlib.sha1(source_bytes).hexdigest()[:16]
+    cache_path = os.path.join(get_image_cache_dir(), f"controller_{digest}_{width}.png")
+    
+    if os.path.exists(cache_path):
+        try:
+            photo = tk.PhotoImage(file=cache_path)
+            add_log(f"Loaded controller image from cache: {cache_path}")
+            return photo
+        except tk.TclError as e:
+            add_log(f"Ignoring unreadable cached image: {e}")
+    
+    # Cache miss: decode and resize once, then store the result for later launches
+    from PIL import Image, ImageTk
+    image = get_embedded_image(source)
+    if not image:
+        return None
+    add_log("Processing the loaded image")
+    wpercent = width / float(image.size[0])
+    hsize = int(float(image.size[1]) * float(wpercent))
+    image = image.resize((width, hsize), Image.Resampling.LANCZOS)
+    save_cached_image(image, cache_path)
+    return ImageTk.PhotoImage(image)
+
 # Fallback function to load image from file
 def load_image_from_file():
     """Fallback to load image from file if embedded fails"""
+    from PIL import Image
     try:
         image_path = resource_path("Dualsense-PS5.png")
         add_log(f"Attempting to load image from file: {image_path}")
@@ -78,7 +285,7 @@ def load_image_from_file():
         add_log("Successfully loaded image from file")
         return image
     except Exception as e:
-        add_log(f"Error loading image from file: {e}")
+        add_log(f"Error loading image from file: {e}", level=ERROR)
         return None
 
 # Function to get the correct file path
@@ -99,18 +306,27 @@ def resource_path(relative_path):
         add_log(f"Resource exists: {os.path.exists(full_path)}")
         return full_path
     except Exception as e:
-        add_log(f"Error in resource_path: {e}")
+        add_log(f"Error in resource_path: {e}", level=ERROR)
         return relative_path
 
-# PyAutoGUI safety configuration
-pyautogui.FAILSAFE = False  # Disable mouse failsafe
-pyautogui.PAUSE = 0.001
-
 # Security settings
 MAX_MOUSE_SPEED = 150  # Maximum pixels per frame
-INPUT_RATE_LIMIT = 0.016  # ~60fps
 EMERGENCY_STOP_COMBO = False
-last_input_time = 0
+
+# Output settings
+OUTPUT_BACKEND = "auto"  # auto, uinput, xtest, pyautogui, null or recording
+
+# SDL settings
+SDL_INIT_MODE = "selective"  # "selective" starts only the event queue and joysticks, "full" calls pygame.init()
+
+# Main loop timing settings
+TICK_RATE = 60  # Main loop ticks per second
+SUPPORTED_TICK_RATES = (60, 120, 250, 500, 1000)
+SCHEDULER_SPIN_TIME = 0.002  # Seconds before a deadline spent spinning instead of sleeping
+SCHEDULER_JITTER_SAMPLES = 1000  # Number of recent ticks kept for jitter statistics
+IDLE_TIMEOUT = 5.0  # Seconds without controller input before the loops stop ticking and wait for it, 0 to never idle
+IDLE_WAIT_TIMEOUT = 0.25  # Longest wait while idle, so reconnect timeouts, profile reloads and focus changes still apply
+MOUSE_IDLE_INTERVAL = 0.05  # Seconds between idle mouse emitter updates; below MOUSE_MAX_STEP so gyro motion is still seen
 
 # Sensitivity settings
 MOUSE_SENSITIVITY = 36  # Current sensitivity
@@ -118,18 +334,162 @@ MOUSE_ACCELERATION = 1.4
 STICK_DEADZONE = 0.15
 STICK_SENSITIVITY = 0.8
 
+# Stick response settings, used when a profile has no 'sticks' section
+STICK_DEADZONE_TYPE = "axial"  # "axial", "radial" or "scaled_radial"
+STICK_OUTER_DEADZONE = 1.0  # Deflection at which a stick reaches full output
+STICK_CURVES = {'left': {'type': 'linear'}, 'right': {'type': 'legacy'}}
+CURVE_TABLE_SIZE = 1024  # Samples in each compiled response curve
+
 # Mouse smoothing settings
 MOUSE_SMOOTHING = 0.8
-MOUSE_MIN_MOVE = 0.1
+MOUSE_EMIT_RATE = 250  # Mouse updates per second, up to 1000
+MOUSE_MAX_STEP = 0.1  # Longest time step integrated in one emit, in seconds
+
+# Analog (PWM) movement settings
+PWM_PERIOD = 0.1  # Seconds per key pulse cycle for bindings with "pwm": true
+PWM_MIN_PULSE = 0.016  # Shortest key press, so a game sees at least one frame of it
+PWM_FULL_DUTY = 0.95  # Duty cycle from which the key is simply held
+TIMER_WHEEL_RATE = 1000  # Timer wheel resolution in ticks per second
+TIMER_WHEEL_SLOTS = 1024
+TIMER_WHEEL_SPIN_TIME = 0.0003  # Shorter than SCHEDULER_SPIN_TIME so a 1 ms tick doesn't spin throughout
+
+# Hotplug settings
+RECONNECT_TIMEOUT = 30  # Seconds a disconnected controller keeps its player number for reconnecting
+
+# Profile hot reload settings
+PROFILE_WATCH = True  # Reload profiles when their files change
+PROFILE_POLL_INTERVAL = 1.0  # Seconds between checks where inotify is unavailable
+PROFILE_RELOAD_DELAY = 0.1  # Seconds given to an editor to finish writing before a changed profile is read
+
+# Native HID input settings
+INPUT_BACKEND = "sdl"  # "sdl" reads controllers through pygame, "hidraw" reads DualSense reports directly (Linux)
+HID_REPORT_DIR = None  # Directory of recorded raw reports (*.bin) read instead of /dev/hidraw*
+HID_RECORD_DIR = None  # Directory the raw reports are also written to, one file per controller
+HID_REPLAY_RATE = 250  # Reports per second when reading recorded reports
+HID_RESCAN_INTERVAL = 2.0  # Seconds between scans for newly connected controllers
+
+# Gyro aiming settings, used by profiles with a 'gyro' section (needs hidraw input)
+GYRO_SENSITIVITY = 10.0  # Mouse pixels per degree of rotation at the linear part of the curve
+GYRO_MAX_SPEED = 360.0  # Degrees per second at the end of the response curve
+GYRO_STILL_NOISE = 0.5  # Degrees per second of gyro noise below which the controller counts as lying still
+GYRO_STILL_ACCEL = 0.01  # Change in g below which the accelerometer counts as still
+GYRO_CALIBRATION_TIME = 1.0  # Seconds the controller must lie still before the gyro bias is learned
+TOUCHPAD_SENSITIVITY = 1.0  # Mouse pixels per touchpad unit (the pad is 1920 x 1080 units) at TOUCHPAD_MAX_SPEED
+TOUCHPAD_MAX_SPEED = 4000.0  # Finger speed in units per second at the end of the response curve
+TOUCHPAD_ACCELERATION = 1.5  # Exponent of the default curve; slow strokes move less than fast ones
+TOUCHPAD_FLICK_SPEED = 1000.0  # Cursor speed in pixels per second above which a lifted finger keeps the cursor gliding
+TOUCHPAD_FRICTION = 5.0  # Rate at which a glide slows down, per second
+TOUCHPAD_SCROLL_SPEED = 0.02  # Wheel clicks per touchpad unit of two-finger movement
+HID_MOTION_RING = 256  # Motion samples kept per controller for the mouse emitter, a power of two
+
+# Focus settings: window text (matched against the X11 window class and title, ignoring case) -> profile
+# path, or None for each controller's usual profile. Output is suspended while no listed window has focus.
+FOCUS_WINDOWS = {"Runiverse": None}
+SUSPENDED_TICK_RATE = 10  # Controller loop rate while output is suspended
+
+# Metrics settings
+METRICS_HOST = "127.0.0.1"  # Metrics are only served locally
+TIME_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)  # Seconds
+COUNT_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128)
+
+# Output queue settings
+OUTPUT_QUEUE_CAPACITY = 1024  # Output events waiting for the output thread before the overflow policy applies
+
+# Sampling profiler settings
+PROFILER_INTERVAL = 0.005  # Seconds between stack samples
+PROFILER_DEFAULT_DURATION = 10  # Seconds profiled by the GUI button
+
+# GUI settings
+GUI_FRAME_RATE = 30  # Maximum overlay redraws per second
 
 # Global variables for control
 running = True
 controller_status = "Initializing..."
+root = None  # Tk window, stays None in headless mode
 button_overlays = {}
 init_timeout = 15  # Timeout in seconds for initialization
 
+# Controller button and axis indices as reported by pygame for the DualSense
+BUTTON_INDEX = {
+    'cross': 0, 'circle': 1, 'square': 2, 'triangle': 3,
+    'create': 4, 'ps': 5, 'options': 6, 'l3': 7, 'r3': 8,
+    'l1': 9, 'r1': 10,
+    'dpad_up': 11, 'dpad_down': 12, 'dpad_left': 13, 'dpad_right': 14,
+    'touchpad': 15, 'mute': 16
+}
+AXIS_INDEX = {
+    'left_x': 0, 'left_y': 1, 'right_x': 2, 'right_y': 3, 'l2': 4, 'r2': 5
+}
+
+# Emergency stop combination (L1 + R1 + L2 + R2), deliberately not part of the profile
+EMERGENCY_BUTTONS = (BUTTON_INDEX['l1'], BUTTON_INDEX['r1'])
+EMERGENCY_TRIGGER_AXES = (AXIS_INDEX['l2'], AXIS_INDEX['r2'])
+EMERGENCY_TRIGGER_THRESHOLD = 0.5
+
+# Mapping profile, loaded from PROFILE_PATH (JSON or TOML) when that file exists
+PROFILE_PATH = "dualsense_profile.json"
+active_profile_path = PROFILE_PATH  # File the main profile is loaded from, watched for changes
+focus_profile_path = None  # Profile of the focused window from FOCUS_WINDOWS, used by every controller while set
+DEVICE_PROFILES = {}  # Player number -> profile path; players not listed use the main profile
+DEFAULT_PROFILE = {
+    'name': "Runiverse",
+    'bindings': [
+        {'axis': 'left_x', 'action': 'keys', 'negative': 'a', 'positive': 'd', 'overlay': 'stick_left',
+         'label': "Left Analog", 'description': "WASD Movement"},
+        {'axis': 'left_y', 'action': 'keys', 'negative': 'w', 'positive': 's', 'overlay': 'stick_left'},
+        {'axis': 'right_x', 'action': 'mouse', 'direction': 'x', 'overlay': 'stick_right',
+         'label': "Right Analog", 'description': "Mouse Movement"},
+        {'axis': 'right_y', 'action': 'mouse', 'direction': 'y', 'overlay': 'stick_right'},
+        {'button': 'l1', 'action': 'press', 'key': 'enter', 'overlay': 'button_l1',
+         'label': "L1", 'description': "Enter (Chat/Confirm)"},
+        {'button': 'dpad_left', 'action': 'press', 'key': 'r', 'overlay': 'dpad_left',
+         'label': "D-Pad Left", 'description': "R (Mount/Unmount)"},
+        {'button': 'dpad_right', 'action': 'press', 'key': 'm', 'overlay': 'dpad_right',
+         'label': "D-Pad Right", 'description': "M (Map)"},
+        {'button': 'dpad_down', 'action': 'press', 'key': 'c', 'overlay': 'dpad_down',
+         'label': "D-Pad Down", 'description': "C (Character)"},
+        {'button': 'dpad_up', 'action': 'press', 'key': 'i', 'overlay': 'dpad_up',
+         'label': "D-Pad Up", 'description': "I (Inventory)"},
+        {'axis': 'l2', 'action': 'press', 'key': 'e', 'threshold': 0.5, 'overlay': 'button_l2',
+         'label': "L2", 'description': "E (Interact)"},
+        {'axis': 'r2', 'action': 'click', 'mouse_button': 'left', 'threshold': 0.5, 'overlay': 'button_r2',
+         'label': "R2", 'description': "Left Click"},
+        {'button': 'cross', 'action': 'press', 'key': '3', 'overlay': 'button_x',
+         'label': "X (Blue)", 'description': "Key 3"},
+        {'button': 'circle', 'action': 'press', 'key': '4', 'overlay': 'button_circle',
+         'label': "Circle (Red)", 'description': "Key 4"},
+        {'button': 'square', 'action': 'press', 'key': '2', 'overlay': 'button_square',
+         'label': "Square (Pink)", 'description': "Key 2"},
+        {'button': 'triangle', 'action': 'press', 'key': '1', 'overlay': 'button_triangle',
+         'label': "Triangle (Green)", 'description': "Key 1"},
+        {'button': 'r1', 'action': 'none', 'overlay': 'button_r1'}
+    ]
+}
+
+def init_pygame(mode=SDL_INIT_MODE):
+    """Starts the SDL subsystems needed to read controllers"""
+    if mode == "full":
+        pygame.init()
+        return
+    # The event queue lives in the video subsystem; the dummy driver provides it without a window.
+    # Audio, fonts and the rest of pygame are never started.
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    # Controller events must keep flowing while the game window has focus
+    os.environ.setdefault('SDL_JOYSTICK_ALLOW_BACKGROUND_EVENTS', '1')
+    pygame.display.init()
+    pygame.joystick.init()
+
+def set_controller_status(status):
+    """Updates the status shown in the window and logs it when it changes"""
+    global controller_status
+    if status != controller_status:
+        controller_status = status
+        add_log(f"Status: {status}")
+
 def show_security_warning():
     """Shows security information to the user"""
+    from tkinter import messagebox
     messagebox.showinfo("Security Information", 
         "Important Security Information:\n\n" +
         "1. Press L1 + R1 + L2 + R2 for emergency stop\n" +
@@ -143,31 +503,2210 @@ def emergency_stop(root, reason="Emergency stop activated"):
     global running
     running = False
     
-    # Release all held keys
-    pyautogui.keyUp('w')
-    pyautogui.keyUp('a')
-    pyautogui.keyUp('s')
-    pyautogui.keyUp('d')
-    pyautogui.mouseUp()
+    # Stop pending key pulses before releasing so nothing is pressed again afterwards
+    timer_wheel.stop()
+    release_all_outputs()
+    add_log(f"Emergency stop: {reason}")
     
-    messagebox.showwarning("Emergency Stop", f"Program stopped: {reason}")
-    root.destroy()
+    if root:
+        from tkinter import messagebox
+        messagebox.showwarning("Emergency Stop", f"Program stopped: {reason}")
+        root.destroy()
     sys.exit(0)
 
+def release_all_outputs():
+    """Releases what every controller holds, then every key the profiles can hold and every mouse button"""
+    if output_backend:
+        held_keys = set(active_profile['held_keys'])
+        for device in list(devices.values()):
+            # Also stops PWM channels and macro runs, releasing whatever they hold
+            release_held_inputs(device['state'])
+            held_keys.update(device['state']['profile']['held_keys'])
+        for key in held_keys:
+            output_backend.key_up(key)
+        # Click bindings and macros can hold any mouse button
+        for button in UINPUT_BUTTON_CODES:
+            output_backend.mouse_up(button)
+        output_backend.flush()
+        # Make sure the releases are out before the program exits
+        output_backend.stop()
+
 def validate_mouse_movement(x_move, y_move):
     """Validates and limits mouse movement"""
-    if abs(x_move) > MAX_MOUSE_SPEED or abs(y_move) > MAX_MOUSE_SPEED:
-        return x_move * (MAX_MOUSE_SPEED / abs(x_move)), y_move * (MAX_MOUSE_SPEED / abs(y_move))
-    return x_move, y_move
-
-def rate_limit_check():
-    """Checks if input rate is within limits"""
-    global last_input_time
-    current_time = time.time()
-    if current_time - last_input_time < INPUT_RATE_LIMIT:
+    return (max(-MAX_MOUSE_SPEED, min(MAX_MOUSE_SPEED, x_move)),
+            max(-MAX_MOUSE_SPEED, min(MAX_MOUSE_SPEED, y_move)))
+
+class Histogram:
+    """Prometheus-style histogram. Each one is written by a single thread, so observe() takes no lock."""
+
+    def __init__(self, name, help_text, buckets=TIME_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, fraction):
+        """Returns the upper bound of the bucket holding the given fraction of samples"""
+        target = self.count * fraction
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float('inf')
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+# Per-stage histograms of the controller loop and its helper threads
+poll_time = Histogram("dualsense_poll_seconds", "Time spent reading the SDL event queue per tick")
+events_per_tick = Histogram("dualsense_events_per_tick", "Controller events handled per tick", COUNT_BUCKETS)
+dispatch_time = Histogram("dualsense_dispatch_seconds", "Time spent mapping a tick's events to output")
+output_time = Histogram("dualsense_output_seconds", "Time the output backend takes to emit one batch")
+mouse_emit_time = Histogram("dualsense_mouse_emit_seconds", "Time spent in one mouse emitter update")
+gui_queue_depth = Histogram("dualsense_gui_queue_depth", "Overlay changes waiting per GUI frame", COUNT_BUCKETS)
+output_queue_depth = Histogram("dualsense_output_queue_depth", "Output events taken per output thread wakeup",
+                               COUNT_BUCKETS)
+output_queue_wait = Histogram("dualsense_output_queue_wait_seconds", "Time output events wait for the output thread")
+STAGE_HISTOGRAMS = (poll_time, events_per_tick, dispatch_time, output_time, mouse_emit_time, gui_queue_depth,
+                    output_queue_depth, output_queue_wait)
+
+def render_metrics():
+    """Returns every metric in the Prometheus text exposition format"""
+    lines = []
+    for histogram in STAGE_HISTOGRAMS:
+        lines.extend(histogram.render())
+    loops = [('controller', tick_scheduler), ('timer', timer_wheel.scheduler)]
+    if mouse_emitter:
+        loops.append(('mouse', mouse_emitter.scheduler))
+    for metric, kind, help_text in (("ticks", "counter", "Loop iterations"),
+                                    ("overruns", "counter", "Loop iterations that missed their deadline entirely")):
+        lines.append(f"# HELP dualsense_loop_{metric}_total {help_text}")
+        lines.append(f"# TYPE dualsense_loop_{metric}_total {kind}")
+        for loop, scheduler in loops:
+            lines.append(f'dualsense_loop_{metric}_total{{loop="{loop}"}} {getattr(scheduler, metric)}')
+    lines.append("# HELP dualsense_loop_lateness_p99_seconds 99th percentile of recent tick lateness")
+    lines.append("# TYPE dualsense_loop_lateness_p99_seconds gauge")
+    for loop, scheduler in loops:
+        lines.append(f'dualsense_loop_lateness_p99_seconds{{loop="{loop}"}} {scheduler.get_jitter_stats()["p99_ms"] / 1000}')
+    for name, kind, help_text, value in (
+            ("dualsense_controllers", "gauge", "Connected controllers", len(devices)),
+            ("dualsense_output_suspended", "gauge", "1 while output is suspended because no game window has focus",
+             int(suspended)),
+            ("dualsense_idle", "gauge", "1 while the controller loop waits for input instead of ticking", int(idle)),
+            ("dualsense_reconnects_total", "counter", "Controllers that reconnected", len(reconnect_times)),
+            ("dualsense_hid_reports_total", "counter", "Native DualSense input reports parsed",
+             hid_input.get_stats()['reports'] if hid_input else 0),
+            ("dualsense_hid_crc_errors_total", "counter", "Bluetooth reports dropped for a bad CRC",
+             hid_input.get_stats()['crc_errors'] if hid_input else 0),
+            ("dualsense_log_pending", "gauge", "Log entries waiting for the writer thread", len(logger.pending)),
+            ("dualsense_output_dropped_moves_total", "counter", "Mouse movements dropped because the output queue was full",
+             output_backend.dropped['move'] if output_backend else 0),
+            ("dualsense_output_dropped_presses_total", "counter", "Presses dropped because the output queue was full",
+             output_backend.dropped['press'] if output_backend else 0)):
+        lines.extend((f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {value}"))
+    return "\n".join(lines) + "\n"
+
+def get_stage_summary():
+    """Returns one line per stage histogram for the debug window"""
+    summary = []
+    for histogram in STAGE_HISTOGRAMS:
+        if not histogram.count:
+            summary.append(f"{histogram.name}: no samples")
+        elif histogram.buckets is TIME_BUCKETS:
+            summary.append(f"{histogram.name}: {histogram.count} samples, mean {histogram.sum / histogram.count * 1000:.3f} ms, "
+                           f"p99 <= {histogram.quantile(0.99) * 1000:g} ms")
+        else:
+            summary.append(f"{histogram.name}: {histogram.count} samples, mean {histogram.sum / histogram.count:.2f}, "
+                           f"p99 <= {histogram.quantile(0.99):g}")
+    return summary
+
+def start_metrics_server(port=None, socket_path=None):
+    """Serves /metrics over local HTTP and/or a Unix socket from a daemon thread"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    import socketserver
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = render_metrics().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        # Every scrape would otherwise fill the bounded log; visible with --log-level debug
+        def log_message(self, format, *args):
+            add_log("Metrics request: " + format, *args, level=DEBUG)
+
+    servers = []
+    if port:
+        servers.append(ThreadingHTTPServer((METRICS_HOST, port), MetricsHandler))
+        add_log(f"Serving metrics on http://{METRICS_HOST}:{port}/metrics")
+    if socket_path:
+        if not hasattr(socketserver, 'ThreadingUnixStreamServer'):
+            raise ValueError("Unix socket metrics are not supported on this platform")
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+        class UnixMetricsHandler(MetricsHandler):
+            def address_string(self):
+                return socket_path
+
+        servers.append(socketserver.ThreadingUnixStreamServer(socket_path, UnixMetricsHandler))
+        add_log(f"Serving metrics on unix socket {socket_path}")
+    for server in servers:
+        server.daemon_threads = True
+        Thread(target=server.serve_forever, name="MetricsServer", daemon=True).start()
+    return servers
+
+class SamplingProfiler:
+    """Samples the stacks of the controller, mouse emitter and timer wheel threads from a separate thread.
+    Nothing runs on the sampled threads, so it is cheap enough to leave on during a game session."""
+
+    def __init__(self, interval=PROFILER_INTERVAL):
+        self.interval = interval
+        self.thread = None
+        self.stacks = {}
+        self.samples = 0
+
+    @property
+    def active(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, duration, output_prefix=None):
+        """Profiles for duration seconds, then writes <prefix>.folded and <prefix>.txt"""
+        if self.active:
+            add_log("Profiler is already running", level=WARNING)
+            return False
+        targets = {}
+        if controller_thread_id is not None:
+            targets[controller_thread_id] = "controller"
+        for name, worker in (("mouse", mouse_emitter), ("timer", timer_wheel)):
+            if worker and worker.thread and worker.thread.ident:
+                targets[worker.thread.ident] = name
+        if not targets:
+            add_log("Profiler has no running threads to sample", level=WARNING)
+            return False
+        if output_prefix is None:
+            output_prefix = os.path.join(get_log_dir(), time.strftime("profile_%Y%m%d_%H%M%S"))
+        self.stacks = {}
+        self.samples = 0
+        self.thread = Thread(target=self.run, args=(targets, duration, output_prefix), name="Profiler", daemon=True)
+        self.thread.start()
+        add_log(f"Profiling {', '.join(targets.values())} for {duration} s")
+        return True
+
+    def run(self, targets, duration, output_prefix):
+        stacks = self.stacks
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline and running:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            for ident, name in targets.items():
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{getattr(code, 'co_qualname', code.co_name)} "
+                                 f"({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(name)
+                stack.reverse()
+                key = tuple(stack)
+                stacks[key] = stacks.get(key, 0) + 1
+            self.samples += 1
+        try:
+            self.write(output_prefix)
+        except OSError as e:
+            add_log(f"Could not write profile {output_prefix}: {e}", level=ERROR)
+
+    def write(self, output_prefix):
+        """Writes collapsed stacks for flamegraph tools and a per-function self/total summary"""
+        directory = os.path.dirname(os.path.abspath(output_prefix))
+        os.makedirs(directory, exist_ok=True)
+        with open(output_prefix + ".folded", 'w', encoding='utf-8') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{';'.join(stack)} {count}\n")
+
+        self_counts = {}
+        total_counts = {}
+        for stack, count in self.stacks.items():
+            thread_name = stack[0]
+            leaf = (thread_name, stack[-1])
+            self_counts[leaf] = self_counts.get(leaf, 0) + count
+            # A recursive function still counts once per sample in its total
+            for function in set(stack[1:]):
+                key = (thread_name, function)
+                total_counts[key] = total_counts.get(key, 0) + count
+        samples = max(self.samples, 1)
+        with open(output_prefix + ".txt", 'w', encoding='utf-8') as f:
+            f.write(f"{self.samples} samples every {self.interval * 1000:g} ms\n")
+            f.write(f"{'self %':>8}{'total %':>9}  thread      function\n")
+            for key in sorted(total_counts, key=lambda key: (-self_counts.get(key, 0), -total_counts[key])):
+                f.write(f"{self_counts.get(key, 0) / samples * 100:>8.1f}{total_counts[key] / samples * 100:>9.1f}  "
+                        f"{key[0]:<11} {key[1]}\n")
+        add_log(f"Profile of {self.samples} samples written to {output_prefix}.folded and .txt")
+
+# Sampling profiler, the thread it treats as the controller loop, and the --sample-profile duration
+profiler = SamplingProfiler()
+controller_thread_id = None
+sample_profile_duration = None
+
+class TickScheduler:
+    """Paces a loop at a fixed rate by sleeping, then spinning briefly up to each deadline"""
+
+    def __init__(self, rate=TICK_RATE, spin_time=SCHEDULER_SPIN_TIME):
+        self.spin_time = spin_time
+        self.jitter = deque(maxlen=SCHEDULER_JITTER_SAMPLES)
+        self.overruns = 0
+        self.ticks = 0
+        self._timer_period_set = False
+        self.last_tick = time.perf_counter()
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        """Changes the tick rate, taking effect from the next tick"""
+        if rate <= 0:
+            raise ValueError(f"Tick rate must be positive, got {rate}")
+        self.rate = rate
+        self.period = 1.0 / rate
+        self.next_deadline = time.perf_counter() + self.period
+
+    def start(self):
+        """Raises the OS timer resolution so short sleeps are accurate (Windows only)"""
+        if sys.platform == "win32" and not self._timer_period_set:
+            try:
+                import ctypes
+                ctypes.windll.winmm.timeBeginPeriod(1)
+                self._timer_period_set = True
+            except Exception as e:
+                add_log(f"Could not raise timer resolution: {e}", level=WARNING)
+        self.reset()
+
+    def reset(self):
+        """Restarts the deadlines from now, e.g. after the loop was idle"""
+        self.next_deadline = time.perf_counter() + self.period
+        self.last_tick = time.perf_counter()
+
+    def stop(self):
+        """Restores the OS timer resolution"""
+        if self._timer_period_set:
+            import ctypes
+            ctypes.windll.winmm.timeEndPeriod(1)
+            self._timer_period_set = False
+
+    def wait(self):
+        """Blocks until the next tick deadline and returns the real time elapsed since the last tick"""
+        deadline = self.next_deadline
+        remaining = deadline - time.perf_counter()
+        if remaining > self.spin_time:
+            time.sleep(remaining - self.spin_time)
+        # Spin for the last stretch, yielding so other threads keep running
+        while time.perf_counter() < deadline:
+            time.sleep(0)
+
+        now = time.perf_counter()
+        self.jitter.append(now - deadline)
+        self.ticks += 1
+
+        # Resynchronize instead of bursting through missed ticks after a stall
+        self.next_deadline = deadline + self.period
+        if now > self.next_deadline:
+            self.overruns += 1
+            self.next_deadline = now + self.period
+
+        delta_time = now - self.last_tick
+        self.last_tick = now
+        return delta_time
+
+    def get_jitter_stats(self):
+        """Returns tick lateness statistics in milliseconds over the recent ticks"""
+        samples = sorted(self.jitter)
+        if not samples:
+            return {'rate': self.rate, 'ticks': self.ticks, 'overruns': self.overruns,
+                    'mean_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0}
+        return {
+            'rate': self.rate,
+            'ticks': self.ticks,
+            'overruns': self.overruns,
+            'mean_ms': sum(samples) / len(samples) * 1000,
+            'p99_ms': samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000,
+            'max_ms': samples[-1] * 1000
+        }
+
+# Scheduler for the controller loop, created here so the debug window can read its jitter
+tick_scheduler = TickScheduler()
+
+# Key codes from linux/input-event-codes.h for the key names used in profiles
+UINPUT_KEY_CODES = {
+    'esc': 1, '1': 2, '2': 3, '3': 4, '4': 5, '5': 6, '6': 7, '7': 8, '8': 9, '9': 10, '0': 11,
+    '-': 12, '=': 13, 'backspace': 14, 'tab': 15,
+    'q': 16, 'w': 17, 'e': 18, 'r': 19, 't': 20, 'y': 21, 'u': 22, 'i': 23, 'o': 24, 'p': 25,
+    '[': 26, ']': 27, 'enter': 28, 'ctrl': 29, 'ctrlleft': 29,
+    'a': 30, 's': 31, 'd': 32, 'f': 33, 'g': 34, 'h': 35, 'j': 36, 'k': 37, 'l': 38,
+    ';': 39, "'": 40, '`': 41, 'shift': 42, 'shiftleft': 42, '\\': 43,
+    'z': 44, 'x': 45, 'c': 46, 'v': 47, 'b': 48, 'n': 49, 'm': 50,
+    ',': 51, '.': 52, '/': 53, 'shiftright': 54, 'alt': 56, 'altleft': 56, 'space': 57, 'capslock': 58,
+    'f1': 59, 'f2': 60, 'f3': 61, 'f4': 62, 'f5': 63, 'f6': 64, 'f7': 65, 'f8': 66, 'f9': 67, 'f10': 68,
+    'f11': 87, 'f12': 88, 'ctrlright': 97, 'altright': 100,
+    'home': 102, 'up': 103, 'pageup': 104, 'left': 105, 'right': 106, 'end': 107, 'down': 108,
+    'pagedown': 109, 'insert': 110, 'delete': 111
+}
+UINPUT_BUTTON_CODES = {'left': 0x110, 'right': 0x111, 'middle': 0x112}
+
+# X keysym names for key names that differ from their keysym
+XTEST_KEYSYM_NAMES = {
+    'enter': 'Return', 'esc': 'Escape', 'tab': 'Tab', 'space': 'space', 'backspace': 'BackSpace',
+    'shift': 'Shift_L', 'shiftleft': 'Shift_L', 'shiftright': 'Shift_R',
+    'ctrl': 'Control_L', 'ctrlleft': 'Control_L', 'ctrlright': 'Control_R',
+    'alt': 'Alt_L', 'altleft': 'Alt_L', 'altright': 'Alt_R', 'capslock': 'Caps_Lock',
+    'up': 'Up', 'down': 'Down', 'left': 'Left', 'right': 'Right',
+    'home': 'Home', 'end': 'End', 'pageup': 'Prior', 'pagedown': 'Next',
+    'insert': 'Insert', 'delete': 'Delete',
+    '-': 'minus', '=': 'equal', '[': 'bracketleft', ']': 'bracketright', ';': 'semicolon',
+    "'": 'apostrophe', '`': 'grave', '\\': 'backslash', ',': 'comma', '.': 'period', '/': 'slash'
+}
+XTEST_BUTTON_NUMBERS = {'left': 1, 'middle': 2, 'right': 3}
+
+class OutputBackend:
+    """Collects output events and emits everything queued during a tick in one batch on flush().
+    Once start() is called, batches are emitted by an output thread so slow output never stalls input."""
+
+    name = "base"
+
+    def __init__(self):
+        self.queue = deque()
+        self.condition = Condition()
+        self.emit_lock = Lock()
+        self.ready = False  # Set by flush(), so the output thread emits whole ticks
+        self.oldest = 0.0  # When the oldest queued event was sent
+        self.dropped = {'move': 0, 'press': 0}
+        self.thread = None
+        self.running = False
+
+    def send(self, events):
+        """Queues a sequence of output event tuples, applying the overflow policy when the queue is full"""
+        with self.condition:
+            queue = self.queue
+            if not queue:
+                self.oldest = time.perf_counter()
+            for event in events:
+                if len(queue) >= OUTPUT_QUEUE_CAPACITY and not self.make_room(event):
+                    continue
+                queue.append(event)
+
+    def make_room(self, event):
+        """Frees a slot for event by dropping mouse motion first, then new presses. Releases are
+        never dropped, even past capacity. Returns False when event itself is dropped."""
+        kind = event[0]
+        if kind == 'move' or kind == 'scroll':
+            self.dropped['move'] += 1
+            return False
+        for index, queued in enumerate(self.queue):
+            if queued[0] == 'move' or queued[0] == 'scroll':
+                del self.queue[index]
+                self.dropped['move'] += 1
+                return True
+        if kind == 'key_up' or kind == 'mouse_up':
+            return True
+        self.dropped['press'] += 1
         return False
-    last_input_time = current_time
-    return True
+
+    def key_down(self, key):
+        self.send((('key_down', key),))
+
+    def key_up(self, key):
+        self.send((('key_up', key),))
+
+    def press(self, key):
+        self.send((('key_down', key), ('key_up', key)))
+
+    def mouse_down(self, button='left'):
+        self.send((('mouse_down', button),))
+
+    def mouse_up(self, button='left'):
+        self.send((('mouse_up', button),))
+
+    def move_rel(self, dx, dy):
+        self.send((('move', dx, dy),))
+
+    def scroll(self, dx, dy):
+        """Scrolls by whole wheel clicks; positive dy scrolls up and positive dx scrolls right"""
+        self.send((('scroll', dx, dy),))
+
+    def flush(self):
+        """Emits every queued event in a single batch, on the output thread when it is running"""
+        with self.condition:
+            if not self.queue:
+                return
+            if self.thread is not None:
+                self.ready = True
+                self.condition.notify()
+                return
+            events = list(self.queue)
+            self.queue.clear()
+        with self.emit_lock:
+            started = time.perf_counter()
+            self.emit_batch(events)
+            # Observed under the lock, since several threads may flush
+            output_time.observe(time.perf_counter() - started)
+
+    def start(self):
+        """Moves emitting onto a dedicated output thread"""
+        if self.thread is not None:
+            return
+        self.running = True
+        self.thread = Thread(target=self.run, name="Output", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and not self.ready:
+                    self.condition.wait()
+                if not self.running and not self.queue:
+                    return
+                # Take everything flushed so far in one go
+                events = list(self.queue)
+                self.queue.clear()
+                self.ready = False
+                oldest = self.oldest
+            started = time.perf_counter()
+            output_queue_depth.observe(len(events))
+            output_queue_wait.observe(started - oldest)
+            with self.emit_lock:
+                self.emit_batch(events)
+            output_time.observe(time.perf_counter() - started)
+
+    def stop(self):
+        """Emits whatever is still queued and returns to emitting on the flushing thread"""
+        thread = self.thread
+        if thread is None:
+            return
+        with self.condition:
+            self.running = False
+            self.ready = True
+            self.condition.notify()
+        if thread is not current_thread():
+            thread.join(timeout=1)
+        self.thread = None
+        self.flush()
+
+    def emit_batch(self, events):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class NullBackend(OutputBackend):
+    """Discards all output, for running the mapper headless"""
+
+    name = "null"
+
+    def __init__(self):
+        super().__init__()
+        self.event_count = 0
+
+    def emit_batch(self, events):
+        self.event_count += len(events)
+
+class RecordingBackend(OutputBackend):
+    """Keeps every emitted event with the perf_counter time it reached the output layer"""
+
+    name = "recording"
+
+    def __init__(self, clock=time.perf_counter):
+        super().__init__()
+        self.clock = clock
+        self.events = []
+
+    def emit_batch(self, events):
+        now = self.clock()
+        self.events.extend((now, event) for event in events)
+
+    def clear(self):
+        with self.emit_lock:
+            self.events = []
+
+class PyAutoGUIBackend(OutputBackend):
+    """Portable fallback that emits through pyautogui without its per-call pause"""
+
+    name = "pyautogui"
+
+    def __init__(self):
+        super().__init__()
+        import pyautogui
+        pyautogui.FAILSAFE = False  # Disable mouse failsafe
+        self.pyautogui = pyautogui
+
+    def emit_batch(self, events):
+        pyautogui = self.pyautogui
+        for event in events:
+            kind = event[0]
+            if kind == 'move':
+                pyautogui.moveRel(event[1], event[2], _pause=False)
+            elif kind == 'key_down':
+                pyautogui.keyDown(event[1], _pause=False)
+            elif kind == 'key_up':
+                pyautogui.keyUp(event[1], _pause=False)
+            elif kind == 'mouse_down':
+                pyautogui.mouseDown(button=event[1], _pause=False)
+            elif kind == 'mouse_up':
+                pyautogui.mouseUp(button=event[1], _pause=False)
+            elif kind == 'scroll':
+                if event[2]:
+                    pyautogui.scroll(event[2], _pause=False)
+                if event[1]:
+                    pyautogui.hscroll(event[1], _pause=False)
+
+class UInputBackend(OutputBackend):
+    """Linux virtual keyboard and mouse on /dev/uinput, one write() per batch"""
+
+    name = "uinput"
+
+    EV_SYN = 0x00
+    EV_KEY = 0x01
+    EV_REL = 0x02
+    REL_X = 0x00
+    REL_Y = 0x01
+    REL_HWHEEL = 0x06
+    REL_WHEEL = 0x08
+    UI_SET_EVBIT = 0x40045564
+    UI_SET_KEYBIT = 0x40045565
+    UI_SET_RELBIT = 0x40045566
+    UI_DEV_CREATE = 0x5501
+    UI_DEV_DESTROY = 0x5502
+    BUS_VIRTUAL = 0x06
+
+    def __init__(self, path="/dev/uinput"):
+        super().__init__()
+        import fcntl
+        self.fcntl = fcntl
+        self.event_struct = struct.Struct('llHHi')
+        self.fd = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+        try:
+            for ev in (self.EV_SYN, self.EV_KEY, self.EV_REL):
+                fcntl.ioctl(self.fd, self.UI_SET_EVBIT, ev)
+            for code in set(UINPUT_KEY_CODES.values()) | set(UINPUT_BUTTON_CODES.values()):
+                fcntl.ioctl(self.fd, self.UI_SET_KEYBIT, code)
+            for rel in (self.REL_X, self.REL_Y, self.REL_HWHEEL, self.REL_WHEEL):
+                fcntl.ioctl(self.fd, self.UI_SET_RELBIT, rel)
+            # Legacy uinput_user_dev setup: name, bus/vendor/product/version, ff_effects_max, abs limits.
+            # A virtual bus and no vendor ids, so nothing matching on Sony's ids takes it for a second controller.
+            device = struct.pack('80sHHHHI', b"Runiverse Mapper Keyboard and Mouse", self.BUS_VIRTUAL, 0, 0, 1, 0)
+            os.write(self.fd, device + bytes(4 * 64 * 4))
+            fcntl.ioctl(self.fd, self.UI_DEV_CREATE)
+        except Exception:
+            os.close(self.fd)
+            raise
+
+    def emit_batch(self, events):
+        pack = self.event_struct.pack
+        syn = pack(0, 0, self.EV_SYN, 0, 0)
+        chunks = []
+        for event in events:
+            kind = event[0]
+            if kind == 'move':
+                if event[1]:
+                    chunks.append(pack(0, 0, self.EV_REL, self.REL_X, event[1]))
+                if event[2]:
+                    chunks.append(pack(0, 0, self.EV_REL, self.REL_Y, event[2]))
+            elif kind == 'scroll':
+                if event[1]:
+                    chunks.append(pack(0, 0, self.EV_REL, self.REL_HWHEEL, event[1]))
+                if event[2]:
+                    chunks.append(pack(0, 0, self.EV_REL, self.REL_WHEEL, event[2]))
+            elif kind == 'key_down' or kind == 'key_up':
+                code = UINPUT_KEY_CODES.get(event[1])
+                if code is None:
+                    continue
+                chunks.append(pack(0, 0, self.EV_KEY, code, 1 if kind == 'key_down' else 0))
+            elif kind == 'mouse_down' or kind == 'mouse_up':
+                code = UINPUT_BUTTON_CODES.get(event[1])
+                if code is None:
+                    continue
+                chunks.append(pack(0, 0, self.EV_KEY, code, 1 if kind == 'mouse_down' else 0))
+            else:
+                continue
+            # Separate reports so a press and release in the same batch are both seen
+            chunks.append(syn)
+        if chunks:
+            os.write(self.fd, b''.join(chunks))
+
+    def close(self):
+        try:
+            self.fcntl.ioctl(self.fd, self.UI_DEV_DESTROY)
+        finally:
+            os.close(self.fd)
+
+class XTestBackend(OutputBackend):
+    """X11 XTest fake input, sent with a single XFlush per batch"""
+
+    name = "xtest"
+
+    def __init__(self):
+        super().__init__()
+        import ctypes
+        import ctypes.util
+        xlib = ctypes.CDLL(ctypes.util.find_library('X11') or 'libX11.so.6')
+        xtst = ctypes.CDLL(ctypes.util.find_library('Xtst') or 'libXtst.so.6')
+        # No XInitThreads: it must precede every other Xlib call in the process, and emit_lock already keeps
+        # this display to one thread at a time
+        xlib.XOpenDisplay.restype = ctypes.c_void_p
+        xlib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        xlib.XStringToKeysym.restype = ctypes.c_ulong
+        xlib.XStringToKeysym.argtypes = [ctypes.c_char_p]
+        xlib.XKeysymToKeycode.restype = ctypes.c_ubyte
+        xlib.XKeysymToKeycode.argtypes = [ctypes.c_void_p, ctypes.c_ulong]
+        xlib.XFlush.argtypes = [ctypes.c_void_p]
+        xlib.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        xtst.XTestFakeKeyEvent.argtypes = [ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_ulong]
+        xtst.XTestFakeButtonEvent.argtypes = [ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_ulong]
+        xtst.XTestFakeRelativeMotionEvent.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_int, ctypes.c_ulong]
+        self.display = xlib.XOpenDisplay(None)
+        if not self.display:
+            raise OSError("Cannot open X display")
+        self.xlib = xlib
+        self.xtst = xtst
+        self.keycodes = {}
+
+    def keycode(self, key):
+        """Returns the cached X keycode for a key name"""
+        code = self.keycodes.get(key)
+        if code is None:
+            keysym = self.xlib.XStringToKeysym(XTEST_KEYSYM_NAMES.get(key, key).encode())
+            code = self.xlib.XKeysymToKeycode(self.display, keysym) if keysym else 0
+            self.keycodes[key] = code
+        return code
+
+    def emit_batch(self, events):
+        xtst = self.xtst
+        display = self.display
+        for event in events:
+            kind = event[0]
+            if kind == 'move':
+                xtst.XTestFakeRelativeMotionEvent(display, event[1], event[2], 0)
+            elif kind == 'key_down' or kind == 'key_up':
+                code = self.keycode(event[1])
+                if code:
+                    xtst.XTestFakeKeyEvent(display, code, kind == 'key_down', 0)
+            elif kind == 'mouse_down' or kind == 'mouse_up':
+                button = XTEST_BUTTON_NUMBERS.get(event[1])
+                if button:
+                    xtst.XTestFakeButtonEvent(display, button, kind == 'mouse_down', 0)
+            elif kind == 'scroll':
+                # X11 scrolls with button clicks: 4/5 up/down, 6/7 left/right
+                for amount, negative, positive in ((event[2], 5, 4), (event[1], 6, 7)):
+                    button = positive if amount > 0 else negative
+                    for _ in range(abs(amount)):
+                        xtst.XTestFakeButtonEvent(display, button, True, 0)
+                        xtst.XTestFakeButtonEvent(display, button, False, 0)
+        self.xlib.XFlush(display)
+
+    def close(self):
+        self.xlib.XCloseDisplay(self.display)
+
+OUTPUT_BACKENDS = {
+    'uinput': UInputBackend,
+    'xtest': XTestBackend,
+    'pyautogui': PyAutoGUIBackend,
+    'null': NullBackend,
+    'recording': RecordingBackend
+}
+
+def create_output_backend(name=OUTPUT_BACKEND):
+    """Creates the requested output backend; 'auto' picks the fastest one available"""
+    if name == "auto":
+        candidates = ['uinput', 'xtest', 'pyautogui'] if sys.platform.startswith('linux') else ['pyautogui']
+    elif name in OUTPUT_BACKENDS:
+        candidates = [name, 'pyautogui'] if name in ('uinput', 'xtest') else [name]
+    else:
+        raise ValueError(f"Unknown output backend '{name}'")
+
+    for candidate in candidates:
+        try:
+            backend = OUTPUT_BACKENDS[candidate]()
+            add_log(f"Using {backend.name} output backend")
+            return backend
+        except Exception as e:
+            add_log(f"Output backend {candidate} unavailable: {e}")
+    raise RuntimeError("No output backend available")
+
+# Output backend, created when the controller loop starts
+output_backend = None
+
+class MouseEmitter:
+    """Turns stick deflection into mouse motion at its own fixed rate, keeping sub-pixel remainders"""
+
+    def __init__(self, backend, rate=MOUSE_EMIT_RATE):
+        self.backend = backend
+        self.scheduler = TickScheduler(min(rate, 1000))
+        self.sources = []
+        self.motion_sources = []
+        self.remainder_x = 0.0
+        self.remainder_y = 0.0
+        self.last_emit = None
+        self.last_motion = 0.0
+        # Set while nothing has moved for IDLE_TIMEOUT; the emitter then only updates every MOUSE_IDLE_INTERVAL
+        self.idle = False
+        self.wakeup = Event()
+        self.thread = None
+        self.running = False
+
+    def attach(self, mouse_state):
+        """Adds a controller's mouse state ({'x', 'y'} stick deflection) as a motion source"""
+        # Replace the list instead of changing it, so the emit thread never sees it mid-update
+        self.sources = self.sources + [mouse_state]
+
+    def detach(self, mouse_state):
+        self.sources = [source for source in self.sources if source is not mouse_state]
+
+    def attach_motion(self, source):
+        """Adds a source whose take() returns the pixels moved since the last emit, such as gyro aiming"""
+        self.motion_sources = self.motion_sources + [source]
+
+    def detach_motion(self, source):
+        self.motion_sources = [other for other in self.motion_sources if other is not source]
+
+    def emit(self, now):
+        """Integrates stick velocity over the real time since the last emit and sends whole pixels.
+        Returns True if any source is moving."""
+        if self.last_emit is None:
+            self.last_emit = now
+            return False
+        delta_time = min(now - self.last_emit, MOUSE_MAX_STEP)
+        self.last_emit = now
+
+        x_move = 0.0
+        y_move = 0.0
+        for mouse_state in self.sources:
+            if mouse_state['x'] or mouse_state['y']:
+                # Sources hold shaped speeds in pixels per 60 Hz frame, already scaled by their profile's sensitivity
+                x_frame, y_frame = validate_mouse_movement(mouse_state['x'], mouse_state['y'])
+                x_move += x_frame
+                y_move += y_frame
+        x_pixels = 0.0
+        y_pixels = 0.0
+        for source in self.motion_sources:
+            x_source, y_source = source.take()
+            x_pixels += x_source
+            y_pixels += y_source
+
+        if not x_move and not y_move and not x_pixels and not y_pixels:
+            self.remainder_x = 0.0
+            self.remainder_y = 0.0
+            return False
+
+        # Normalize stick speeds to 60 FPS, add the motion sources' pixels and keep the fraction for the next emit
+        x_move = x_move * delta_time * 60 + x_pixels + self.remainder_x
+        y_move = y_move * delta_time * 60 + y_pixels + self.remainder_y
+        x_pixels = int(x_move)
+        y_pixels = int(y_move)
+        self.remainder_x = x_move - x_pixels
+        self.remainder_y = y_move - y_pixels
+
+        if x_pixels or y_pixels:
+            self.backend.move_rel(x_pixels, y_pixels)
+            self.backend.flush()
+        return True
+
+    def wake(self):
+        """Returns the emitter to its full rate, e.g. when a stick starts moving"""
+        self.wakeup.set()
+
+    def run(self):
+        self.scheduler.start()
+        while self.running and running:
+            if self.idle:
+                # Motion sources are still polled, since gyro motion arrives without any event
+                self.wakeup.wait(MOUSE_IDLE_INTERVAL)
+                self.wakeup.clear()
+            else:
+                self.scheduler.wait()
+            started = time.perf_counter()
+            if self.emit(started):
+                self.last_motion = started
+                if self.idle:
+                    self.idle = False
+                    self.scheduler.reset()
+            elif IDLE_TIMEOUT and not self.idle and started - self.last_motion > IDLE_TIMEOUT:
+                self.idle = True
+            mouse_emit_time.observe(time.perf_counter() - started)
+        self.scheduler.stop()
+
+    def start(self):
+        self.running = True
+        self.last_emit = None
+        self.last_motion = time.perf_counter()
+        self.idle = False
+        self.thread = Thread(target=self.run, name="MouseEmitter", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread and self.thread is not current_thread():
+            self.thread.join(timeout=1)
+
+# Mouse emitter, created when the controller loop starts
+mouse_emitter = None
+
+class TimerWheel:
+    """Hashed timing wheel that fires callbacks at millisecond resolution, from its own thread or advance()"""
+
+    def __init__(self, rate=TIMER_WHEEL_RATE, slots=TIMER_WHEEL_SLOTS, clock=time.perf_counter):
+        self.rate = rate
+        self.resolution = 1.0 / rate
+        self.slots = [[] for _ in range(slots)]
+        self.clock = clock
+        self.origin = clock()
+        self.cursor = 0  # Last tick whose callbacks have fired
+        self.pending = 0
+        self.firing = False
+        self.condition = Condition()
+        self.scheduler = TickScheduler(rate, TIMER_WHEEL_SPIN_TIME)
+        self.thread = None
+        self.running = False
+
+    def tick_at(self, now):
+        return int((now - self.origin) * self.rate + 1e-9)
+
+    def schedule(self, delay, callback):
+        """Runs callback on the wheel thread after delay seconds, rounded to the nearest tick"""
+        with self.condition:
+            if not self.pending and not self.firing:
+                # The cursor stands still while idle, so catch it up before counting from it
+                self.cursor = max(self.cursor, self.tick_at(self.clock()))
+            due = self.cursor + max(1, round(delay * self.rate))
+            self.slots[due % len(self.slots)].append((due, callback))
+            self.pending += 1
+            self.condition.notify()
+
+    def advance(self, now):
+        """Fires, in order, every callback due up to now"""
+        target = self.tick_at(now)
+        while True:
+            with self.condition:
+                if self.cursor >= target:
+                    return
+                if not self.pending:
+                    self.cursor = target
+                    return
+                self.cursor += 1
+                slot = self.slots[self.cursor % len(self.slots)]
+                if not slot:
+                    continue
+                # Entries for later turns of the wheel share the slot and stay in it
+                due = [callback for tick, callback in slot if tick == self.cursor]
+                slot[:] = [entry for entry in slot if entry[0] != self.cursor]
+                self.pending -= len(due)
+                self.firing = True
+            # Callbacks run outside the lock so they can schedule again, relative to this tick
+            for callback in due:
+                try:
+                    callback()
+                except Exception as e:
+                    add_log("Timer callback error: %s", e, level=ERROR)
+            self.firing = False
+
+    def run(self):
+        self.scheduler.start()
+        while self.running and running:
+            with self.condition:
+                if not self.pending:
+                    # Nothing scheduled: sleep until schedule() or stop() wakes us
+                    self.condition.wait()
+                    self.scheduler.reset()
+                    continue
+            self.scheduler.wait()
+            self.advance(time.perf_counter())
+        self.scheduler.stop()
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.running = True
+        self.thread = Thread(target=self.run, name="TimerWheel", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        with self.condition:
+            self.condition.notify()
+        if self.thread and self.thread is not current_thread():
+            self.thread.join(timeout=1)
+
+# Timer wheel for key pulses, started with the controller loop
+timer_wheel = TimerWheel()
+
+class PwmChannel:
+    """Pulses one of a pair of keys with a duty cycle set by the input thread, timed by the timer wheel"""
+
+    def __init__(self, wheel, negative, positive, period=PWM_PERIOD):
+        self.wheel = wheel
+        self.negative = negative
+        self.positive = positive
+        self.period = period
+        self.duty = 0.0
+        self.direction = 0
+        self.held = None
+        self.generation = 0  # Bumped on restart so timers from an earlier cycle are ignored
+        self.lock = Lock()
+
+    def set_duty(self, duty):
+        """Stores the duty cycle (-1..1); only a change of direction schedules anything"""
+        direction = (duty > 0) - (duty < 0)
+        with self.lock:
+            self.duty = duty
+            if direction == self.direction:
+                return
+            self.direction = direction
+            self.generation += 1
+            generation = self.generation
+            self.wheel.schedule(0, lambda: self.cycle(generation))
+
+    def cycle(self, generation):
+        """Starts one pulse period: presses the key and schedules its release and the next period"""
+        with self.lock:
+            if generation != self.generation:
+                return
+            duty = self.duty
+            key = self.positive if duty > 0 else self.negative if duty < 0 else None
+            if self.held and self.held != key:
+                output_backend.key_up(self.held)
+                self.held = None
+            if key:
+                if self.held != key:
+                    output_backend.key_down(key)
+                    self.held = key
+                on_time = max(abs(duty) * self.period, PWM_MIN_PULSE)
+                if on_time < self.period * PWM_FULL_DUTY:
+                    self.wheel.schedule(on_time, lambda: self.pulse_end(generation))
+                self.wheel.schedule(self.period, lambda: self.cycle(generation))
+            output_backend.flush()
+
+    def pulse_end(self, generation):
+        with self.lock:
+            if generation != self.generation or not self.held:
+                return
+            output_backend.key_up(self.held)
+            self.held = None
+            output_backend.flush()
+
+    def release(self):
+        """Stops pulsing and releases the held key immediately"""
+        with self.lock:
+            self.generation += 1
+            self.duty = 0.0
+            self.direction = 0
+            if self.held:
+                output_backend.key_up(self.held)
+                self.held = None
+
+def apply_mouse_acceleration(value):
+    """Applies smooth acceleration to mouse movement"""
+    if abs(value) < 0.3:
+        return value * 0.4
+    elif abs(value) < 0.6:
+        return value * 0.7
+    return (abs(value) ** MOUSE_ACCELERATION) * (1 if value >= 0 else -1)
+
+def monotone_spline(points):
+    """Builds a monotone cubic spline through [x, y] points (Fritsch-Carlson), flat outside the points"""
+    if not points or len(points) < 2:
+        raise ValueError("Spline curves need at least two points")
+    points = sorted((float(x), float(y)) for x, y in points)
+    xs = [x for x, y in points]
+    ys = [y for x, y in points]
+    if any(b <= a for a, b in zip(xs, xs[1:])):
+        raise ValueError("Spline points need distinct x values")
+
+    slopes = [(ys[i + 1] - ys[i]) / (xs[i + 1] - xs[i]) for i in range(len(xs) - 1)]
+    tangents = [slopes[0]]
+    for before, after in zip(slopes, slopes[1:]):
+        tangents.append((before + after) / 2 if before * after > 0 else 0.0)
+    tangents.append(slopes[-1])
+    # Limit the tangents so the spline never overshoots between points
+    for i, slope in enumerate(slopes):
+        if slope == 0:
+            tangents[i] = tangents[i + 1] = 0.0
+            continue
+        a = tangents[i] / slope
+        b = tangents[i + 1] / slope
+        length = a * a + b * b
+        if length > 9:
+            factor = 3 / math.sqrt(length)
+            tangents[i] = factor * a * slope
+            tangents[i + 1] = factor * b * slope
+
+    def evaluate(value):
+        if value <= xs[0]:
+            return ys[0]
+        if value >= xs[-1]:
+            return ys[-1]
+        i = bisect_right(xs, value) - 1
+        width = xs[i + 1] - xs[i]
+        t = (value - xs[i]) / width
+        t2 = t * t
+        t3 = t2 * t
+        return ((2 * t3 - 3 * t2 + 1) * ys[i] + (t3 - 2 * t2 + t) * width * tangents[i]
+                + (-2 * t3 + 3 * t2) * ys[i + 1] + (t3 - t2) * width * tangents[i + 1])
+    return evaluate
+
+def build_curve_function(spec):
+    """Returns the response function for a profile curve entry, mapping 0..1 deflection to output"""
+    kind = spec.get('type', 'linear')
+    if kind == 'linear':
+        function = lambda value: value
+    elif kind == 'power':
+        exponent = float(spec.get('exponent', 2.0))
+        if exponent <= 0:
+            raise ValueError("Power curves need a positive exponent")
+        function = lambda value: value ** exponent
+    elif kind == 'exponential':
+        strength = float(spec.get('strength', 3.0))
+        if abs(strength) < 1e-6:
+            function = lambda value: value
+        else:
+            span = math.expm1(strength)
+            function = lambda value: math.expm1(strength * value) / span
+    elif kind == 'spline':
+        function = monotone_spline(spec.get('points'))
+    elif kind == 'legacy':
+        # The original piecewise mouse acceleration, applied after STICK_SENSITIVITY
+        function = lambda value: abs(apply_mouse_acceleration(value * STICK_SENSITIVITY))
+    else:
+        raise ValueError(f"Unknown curve type '{kind}'")
+
+    scale = float(spec.get('scale', 1.0))
+    if scale == 1.0:
+        return function
+    return lambda value: function(value) * scale
+
+class ResponseCurve:
+    """A response function sampled into a dense lookup table over 0..1 and read with linear interpolation"""
+
+    def __init__(self, function, size=CURVE_TABLE_SIZE):
+        self.last = size - 1
+        self.table = array('d', [function(i / self.last) for i in range(size)])
+
+    def lookup(self, value):
+        """Returns the curve output for 0 <= value, clamping values past 1.0 to the end of the table"""
+        position = value * self.last
+        if position >= self.last:
+            return self.table[self.last]
+        index = int(position)
+        low = self.table[index]
+        return low + (self.table[index + 1] - low) * (position - index)
+
+    def lookup_batch(self, values):
+        """Runs a whole sequence of samples through the table"""
+        return array('d', map(self.lookup, values))
+
+class StickProcessor:
+    """Applies a stick's deadzone shape, outer deadzone and response curve to its (x, y) deflection"""
+
+    def __init__(self, deadzone=STICK_DEADZONE_TYPE, inner=STICK_DEADZONE, outer=STICK_OUTER_DEADZONE, curve=None):
+        if deadzone not in ('axial', 'radial', 'scaled_radial'):
+            raise ValueError(f"Unknown deadzone type '{deadzone}'")
+        if not 0 <= inner < outer <= 1.5:
+            raise ValueError(f"Deadzones need 0 <= inner < outer <= 1.5, got {inner} and {outer}")
+        self.deadzone = deadzone
+        self.inner = inner
+        self.outer = outer
+        shape = build_curve_function(curve or {'type': 'linear'})
+
+        # Fold the deadzone normalization into the table, which is indexed by raw deflection
+        if deadzone == 'scaled_radial':
+            normalize = lambda value: min(max(value - inner, 0.0) / (outer - inner), 1.0)
+        else:
+            normalize = lambda value: min(value / outer, 1.0)
+        self.curve = ResponseCurve(lambda value: shape(normalize(value * outer)))
+        self.scale = 1.0 / outer
+
+    def process(self, x, y):
+        """Returns the shaped (x, y) output for a raw stick position"""
+        inner = self.inner
+        lookup = self.curve.lookup
+        if self.deadzone == 'axial':
+            x_size = abs(x)
+            y_size = abs(y)
+            x_out = 0.0 if x_size <= inner else math.copysign(lookup(x_size * self.scale), x)
+            y_out = 0.0 if y_size <= inner else math.copysign(lookup(y_size * self.scale), y)
+            return x_out, y_out
+        magnitude = math.hypot(x, y)
+        if magnitude <= inner:
+            return 0.0, 0.0
+        factor = lookup(magnitude * self.scale) / magnitude
+        return x * factor, y * factor
+
+    def process_batch(self, xs, ys):
+        """Shapes whole sequences of x and y samples, e.g. a recorded session for offline tuning"""
+        x_out = array('d')
+        y_out = array('d')
+        process = self.process
+        for x, y in zip(xs, ys):
+            x_shaped, y_shaped = process(x, y)
+            x_out.append(x_shaped)
+            y_out.append(y_shaped)
+        return x_out, y_out
+
+def create_stick_processor(settings, name, deadzone=STICK_DEADZONE):
+    """Builds the processor for one stick from a profile's 'sticks' entry"""
+    return StickProcessor(
+        settings.get('deadzone', STICK_DEADZONE_TYPE),
+        float(settings.get('inner', deadzone)),
+        float(settings.get('outer', STICK_OUTER_DEADZONE)),
+        settings.get('curve', STICK_CURVES.get(name))
+    )
+
+# Size of the compiled dispatch tables
+MAX_BUTTONS = 32
+MAX_AXES = 8
+
+# Axis index -> (stick name, component) for the axes shaped as a pair
+STICK_AXIS_NAMES = {
+    AXIS_INDEX['left_x']: ('left', 0),
+    AXIS_INDEX['left_y']: ('left', 1),
+    AXIS_INDEX['right_x']: ('right', 0),
+    AXIS_INDEX['right_y']: ('right', 1)
+}
+
+def load_profile(path=PROFILE_PATH):
+    """Loads a mapping profile from a JSON or TOML file, or returns the default profile"""
+    if not path or not os.path.exists(path):
+        add_log(f"Profile {path} not found, using default profile")
+        return DEFAULT_PROFILE
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    if path.lower().endswith('.toml'):
+        if tomllib is None:
+            raise ValueError("TOML profiles require Python 3.11 or newer")
+        profile = tomllib.loads(data.decode('utf-8'))
+    else:
+        profile = json.loads(data)
+    add_log(f"Loaded profile '{profile.get('name', path)}' from {path}")
+    return profile
+
+def resolve_index(value, names, limit, kind):
+    """Turns a button or axis name (or raw number) from a profile into an index"""
+    if isinstance(value, int) and not isinstance(value, bool):
+        index = value
+    elif value in names:
+        index = names[value]
+    else:
+        raise ValueError(f"Unknown {kind} '{value}'")
+    if not 0 <= index < limit:
+        raise ValueError(f"{kind.capitalize()} index {index} out of range")
+    return index
+
+def compile_action(binding):
+    """Returns the output events sent on press and on release for a press/hold/click/none action"""
+    action = binding.get('action', 'none')
+    if action == 'press':
+        return (('key_down', binding['key']), ('key_up', binding['key'])), None
+    if action == 'hold':
+        return (('key_down', binding['key']),), (('key_up', binding['key']),)
+    if action == 'click':
+        mouse_button = binding.get('mouse_button', 'left')
+        return (('mouse_down', mouse_button),), (('mouse_up', mouse_button),)
+    if action == 'none':
+        return None, None
+    if action == 'macro':
+        raise ValueError("Macros can only be bound to buttons")
+    raise ValueError(f"Unknown action '{action}'")
+
+MACRO_STEP_KINDS = ('key_down', 'key_up', 'press', 'click', 'mouse_down', 'mouse_up', 'move', 'wait')
+
+def compile_macro(binding):
+    """Compiles macro steps into segments of (output events, seconds to wait afterwards)"""
+    steps = binding.get('steps')
+    if not steps:
+        raise ValueError("Macro bindings need a non-empty 'steps' list")
+    segments = []
+    events = []
+    held_keys = set()
+    for step in steps:
+        if not isinstance(step, dict) or len(step) != 1:
+            raise ValueError(f"Macro steps need exactly one of {', '.join(MACRO_STEP_KINDS)}: {step}")
+        kind, value = next(iter(step.items()))
+        if kind == 'wait':
+            if float(value) < 0:
+                raise ValueError(f"Macro wait must not be negative: {value}")
+            segments.append((tuple(events), float(value)))
+            events = []
+        elif kind == 'press':
+            events.extend((('key_down', value), ('key_up', value)))
+        elif kind == 'click':
+            events.extend((('mouse_down', value), ('mouse_up', value)))
+        elif kind == 'move':
+            events.append(('move', int(value[0]), int(value[1])))
+        elif kind in MACRO_STEP_KINDS:
+            events.append((kind, value))
+            if kind == 'key_down':
+                held_keys.add(value)
+        else:
+            raise ValueError(f"Unknown macro step '{kind}'")
+    if events:
+        segments.append((tuple(events), 0.0))
+    # Waits with nothing after them only matter when looping
+    while len(segments) > 1 and not segments[-1][0]:
+        wait = segments.pop()[1]
+        segments[-1] = (segments[-1][0], segments[-1][1] + wait)
+
+    on_repeat = binding.get('on_repeat', 'overlap')
+    if on_repeat not in ('overlap', 'restart', 'toggle'):
+        raise ValueError(f"Unknown macro on_repeat '{on_repeat}'")
+    loop = bool(binding.get('loop', False))
+    if loop and not sum(wait for events, wait in segments):
+        raise ValueError("Looping macros need at least one wait")
+    return {
+        'segments': tuple(segments),
+        'loop': loop,
+        'on_repeat': on_repeat,
+        'cancel_on_release': bool(binding.get('cancel_on_release', False)),
+        'held_keys': held_keys
+    }
+
+def compile_gyro(settings):
+    """Compiles a profile's 'gyro' section"""
+    ratchet = settings.get('ratchet')
+    gyro = {
+        'sensitivity': float(settings.get('sensitivity', GYRO_SENSITIVITY)),
+        'max_speed': float(settings.get('max_speed', GYRO_MAX_SPEED)),
+        'deadzone': float(settings.get('deadzone', 0.0)),
+        'curve': ResponseCurve(build_curve_function(settings.get('curve', {'type': 'linear'}))),
+        # Held to pause gyro aiming, like lifting a mouse to re-center it
+        'ratchet': resolve_index(ratchet, BUTTON_INDEX, MAX_BUTTONS, 'button') if ratchet is not None else None,
+        'invert_x': -1.0 if settings.get('invert_x') else 1.0,
+        'invert_y': -1.0 if settings.get('invert_y') else 1.0
+    }
+    if gyro['sensitivity'] <= 0 or gyro['max_speed'] <= 0:
+        raise ValueError("Gyro sensitivity and max_speed must be positive")
+    return gyro
+
+def compile_touchpad(settings):
+    """Compiles a profile's 'touchpad' section"""
+    touchpad = {
+        'sensitivity': float(settings.get('sensitivity', TOUCHPAD_SENSITIVITY)),
+        'max_speed': float(settings.get('max_speed', TOUCHPAD_MAX_SPEED)),
+        'curve': ResponseCurve(build_curve_function(
+            settings.get('curve', {'type': 'power', 'exponent': TOUCHPAD_ACCELERATION}))),
+        'flick': bool(settings.get('flick', True)),
+        'scroll': bool(settings.get('scroll', True)),
+        'scroll_speed': float(settings.get('scroll_speed', TOUCHPAD_SCROLL_SPEED))
+    }
+    if touchpad['sensitivity'] <= 0 or touchpad['max_speed'] <= 0:
+        raise ValueError("Touchpad sensitivity and max_speed must be positive")
+    return touchpad
+
+def compile_profile(profile):
+    """Compiles a profile into flat dispatch tables indexed by button and axis number"""
+    button_down = [None] * MAX_BUTTONS
+    button_up = [None] * MAX_BUTTONS
+    macros = [None] * MAX_BUTTONS
+    axes = [None] * MAX_AXES
+    mappings = []
+    held_keys = set()
+    sticks = {}
+    stick_settings = profile.get('sticks', {})
+    # Profile-wide settings override the module constants
+    settings = profile.get('settings', {})
+    mouse_sensitivity = float(settings.get('mouse_sensitivity', MOUSE_SENSITIVITY))
+    stick_deadzone = float(settings.get('stick_deadzone', STICK_DEADZONE))
+    if mouse_sensitivity <= 0 or not 0 <= stick_deadzone < 1:
+        raise ValueError("Profile settings need mouse_sensitivity > 0 and 0 <= stick_deadzone < 1")
+
+    for binding in profile.get('bindings', []):
+        action = binding.get('action', 'none')
+        overlay = binding.get('overlay')
+
+        if 'button' in binding:
+            index = resolve_index(binding['button'], BUTTON_INDEX, MAX_BUTTONS, 'button')
+            if action == 'macro':
+                macros[index] = compile_macro(binding)
+                held_keys.update(macros[index]['held_keys'])
+                down, up = None, None
+            else:
+                down, up = compile_action(binding)
+            button_down[index] = (down, overlay)
+            button_up[index] = (up, overlay)
+            if action == 'hold':
+                held_keys.add(binding['key'])
+        elif 'axis' in binding:
+            index = resolve_index(binding['axis'], AXIS_INDEX, MAX_AXES, 'axis')
+            if action in ('keys', 'mouse'):
+                if index not in STICK_AXIS_NAMES:
+                    raise ValueError(f"'{action}' bindings need a stick axis, got axis {index}")
+                name, component = STICK_AXIS_NAMES[index]
+                if name not in sticks:
+                    sticks[name] = {
+                        'name': name,
+                        'processor': create_stick_processor(stick_settings.get(name, {}), name, stick_deadzone),
+                        'outputs': [None, None],
+                        'overlay': None
+                    }
+                stick = sticks[name]
+                if action == 'keys' and binding.get('pwm'):
+                    stick['outputs'][component] = (apply_pwm_axis, {
+                        'negative': binding['negative'],
+                        'positive': binding['positive'],
+                        'period': float(binding.get('pwm_period', PWM_PERIOD))
+                    })
+                    held_keys.update((binding['negative'], binding['positive']))
+                elif action == 'keys':
+                    stick['outputs'][component] = (apply_key_axis, {
+                        'negative': binding['negative'],
+                        'positive': binding['positive']
+                    })
+                    held_keys.update((binding['negative'], binding['positive']))
+                else:
+                    if binding.get('direction') not in ('x', 'y'):
+                        raise ValueError(f"Mouse axis {index} needs direction 'x' or 'y'")
+                    stick['outputs'][component] = (apply_mouse_axis, {
+                        'direction': binding['direction'],
+                        'sensitivity': mouse_sensitivity
+                    })
+                stick['overlay'] = stick['overlay'] or overlay
+                axes[index] = (handle_stick_axis, {'stick': stick, 'component': component})
+            else:
+                down, up = compile_action(binding)
+                axes[index] = (handle_trigger_axis, {
+                    'axis': index,
+                    'threshold': float(binding.get('threshold', 0.5)),
+                    'down': down,
+                    'up': up,
+                    'overlay': overlay
+                })
+                if action == 'hold':
+                    held_keys.add(binding['key'])
+        else:
+            raise ValueError(f"Binding needs a 'button' or 'axis': {binding}")
+
+        if binding.get('label') and binding.get('description'):
+            mappings.append((binding['label'], binding['description']))
+
+    return {
+        'name': profile.get('name', "Unnamed"),
+        'button_down': button_down,
+        'button_up': button_up,
+        'macros': macros,
+        'axes': axes,
+        'sticks': sticks,
+        # An empty section turns the feature on with the defaults
+        'gyro': compile_gyro(profile['gyro']) if profile.get('gyro') is not None else None,
+        'touchpad': compile_touchpad(profile['touchpad']) if profile.get('touchpad') is not None else None,
+        'mappings': mappings,
+        'held_keys': held_keys
+    }
+
+def load_active_profile(path=PROFILE_PATH):
+    """Loads and compiles the profile, falling back to the default profile on errors"""
+    try:
+        return compile_profile(load_profile(path))
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        add_log(f"Invalid profile {path}: {e}, using default profile", level=WARNING)
+        return compile_profile(DEFAULT_PROFILE)
+
+def create_controller_state(profile=None):
+    """Creates the per-controller input state used by the axis handlers"""
+    return {
+        'profile': profile or active_profile,
+        'key_states': {},
+        'trigger_states': {},
+        'held_releases': {},
+        'emergency_buttons': {
+            'L1': False,
+            'R1': False,
+            'L2': False,
+            'R2': False
+        },
+        'pwm_channels': {},
+        'macro_runs': {},
+        'stick_values': {
+            'left': [0.0, 0.0],
+            'right': [0.0, 0.0]
+        },
+        'mouse_state': {
+            'x': 0.0,
+            'y': 0.0
+        },
+        'gyro_ratchet': False
+    }
+
+class OverlayState:
+    """Latest overlay state, written by the input thread and drained by the Tk loop at a capped rate"""
+
+    def __init__(self):
+        # Single dict item writes are atomic, so the input thread never takes a lock
+        self.states = {}
+        self.applied = {}
+
+    def set(self, tag, active):
+        self.states[tag] = active
+
+    def clear(self):
+        """Turns every overlay off"""
+        for tag in self.states.copy():
+            self.states[tag] = False
+
+    def snapshot(self, tags):
+        """Returns the state of every given overlay and marks them all as drawn"""
+        current = [(tag, self.states.get(tag, False)) for tag in tags]
+        self.applied = dict(current)
+        return current
+
+    def changes(self):
+        """Returns the overlays whose state differs from what was last drawn"""
+        changed = [(tag, active) for tag, active in self.states.copy().items()
+                   if self.applied.get(tag, False) != active]
+        for tag, active in changed:
+            self.applied[tag] = active
+        return changed
+
+def show_overlay(overlays, tag, active):
+    """Records the overlay state for the next GUI frame"""
+    if tag:
+        overlays.set(tag, active)
+
+def handle_stick_axis(binding, value, state, overlays):
+    """Shapes both axes of a stick together and passes the result to the stick's outputs"""
+    stick = binding['stick']
+    raw = state['stick_values'][stick['name']]
+    raw[binding['component']] = value
+    x, y = stick['processor'].process(raw[0], raw[1])
+    x_output, y_output = stick['outputs']
+    if x_output:
+        x_output[0](x_output[1], x, state)
+    if y_output:
+        y_output[0](y_output[1], y, state)
+    show_overlay(overlays, stick['overlay'], x != 0.0 or y != 0.0)
+
+def apply_key_axis(binding, value, state):
+    """Holds the negative or positive key while the shaped axis value is outside the deadzone"""
+    key_states = state['key_states']
+    negative = binding['negative']
+    positive = binding['positive']
+    if value:
+        pressed, released = (negative, positive) if value < 0 else (positive, negative)
+        if key_states.get(released):
+            output_backend.key_up(released)
+            key_states[released] = False
+        if not key_states.get(pressed):
+            output_backend.key_down(pressed)
+            key_states[pressed] = True
+    else:
+        for key in (negative, positive):
+            if key_states.get(key):
+                output_backend.key_up(key)
+                key_states[key] = False
+
+def apply_pwm_axis(binding, value, state):
+    """Sets the duty cycle of the axis' key pulses; the timer wheel does the pressing"""
+    channel = state['pwm_channels'].get(binding['negative'])
+    if channel is None:
+        if not value:
+            return
+        channel = PwmChannel(timer_wheel, binding['negative'], binding['positive'], binding['period'])
+        state['pwm_channels'][binding['negative']] = channel
+    channel.set_duty(value)
+
+def apply_mouse_axis(binding, value, state):
+    """Stores the mouse speed for the shaped stick value, in pixels per 60 Hz frame"""
+    state['mouse_state'][binding['direction']] = value * binding['sensitivity']
+    if mouse_emitter and mouse_emitter.idle:
+        mouse_emitter.wake()
+
+def handle_trigger_axis(binding, value, state, overlays):
+    """Runs the trigger action once when the trigger crosses its threshold"""
+    active = value > binding['threshold']
+    if active == state['trigger_states'].get(binding['axis'], False):
+        return
+    state['trigger_states'][binding['axis']] = active
+    if active:
+        if binding['down']:
+            output_backend.send(binding['down'])
+        if binding['up']:
+            state['held_releases'][('axis', binding['axis'])] = binding['up']
+    else:
+        release = state['held_releases'].pop(('axis', binding['axis']), None)
+        if release:
+            output_backend.send(release)
+    show_overlay(overlays, binding['overlay'], active)
+
+class MacroRun:
+    """One run of a macro. The first segment is sent right away, the rest on the timer wheel."""
+
+    def __init__(self, macro, wheel):
+        self.segments = macro['segments']
+        self.loop = macro['loop']
+        self.wheel = wheel
+        self.index = 0
+        self.held = set()  # Keys and mouse buttons this run has pressed but not released
+        self.finished = False
+        self.lock = Lock()
+
+    def step(self, flush=True):
+        with self.lock:
+            if self.finished:
+                return
+            events, wait = self.segments[self.index]
+            if events:
+                output_backend.send(events)
+                for event in events:
+                    if event[0] == 'key_down' or event[0] == 'mouse_down':
+                        self.held.add(event)
+                    elif event[0] == 'key_up':
+                        self.held.discard(('key_down', event[1]))
+                    elif event[0] == 'mouse_up':
+                        self.held.discard(('mouse_down', event[1]))
+                if flush:
+                    output_backend.flush()
+            self.index += 1
+            if self.index == len(self.segments):
+                if not self.loop:
+                    self.finished = True
+                    return
+                self.index = 0
+            self.wheel.schedule(wait, self.step)
+
+    def cancel(self):
+        """Stops the run and releases whatever it still holds; the caller flushes"""
+        with self.lock:
+            if self.finished:
+                return
+            self.finished = True
+            for kind, value in self.held:
+                output_backend.send(((('key_up' if kind == 'key_down' else 'mouse_up'), value),))
+            self.held.clear()
+
+def start_macro(macro, state, button):
+    """Starts a macro for a button press, applying its on_repeat policy to runs still going"""
+    runs = [run for run in state['macro_runs'].get(button, ()) if not run.finished]
+    if runs and macro['on_repeat'] != 'overlap':
+        for run in runs:
+            run.cancel()
+        runs = []
+        if macro['on_repeat'] == 'toggle':
+            state['macro_runs'][button] = runs
+            return
+    run = MacroRun(macro, timer_wheel)
+    runs.append(run)
+    state['macro_runs'][button] = runs
+    # Sent with the rest of this tick's output; later segments flush from the wheel thread
+    run.step(flush=False)
+
+def release_held_inputs(state):
+    """Releases every key and mouse button the controller is currently holding"""
+    for key, held in state['key_states'].items():
+        if held:
+            output_backend.key_up(key)
+            state['key_states'][key] = False
+    for release in state['held_releases'].values():
+        output_backend.send(release)
+    state['held_releases'].clear()
+    state['trigger_states'].clear()
+    for channel in state['pwm_channels'].values():
+        channel.release()
+    # Rebuilt on next use, so a reloaded or switched profile's keys and period apply
+    state['pwm_channels'].clear()
+    for runs in state['macro_runs'].values():
+        for run in runs:
+            run.cancel()
+    state['macro_runs'].clear()
+    for values in state['stick_values'].values():
+        values[0] = values[1] = 0.0
+    state['mouse_state']['x'] = 0.0
+    state['mouse_state']['y'] = 0.0
+    state['gyro_ratchet'] = False
+
+def process_event(event, state, overlays):
+    """Runs one joystick event through the emergency check and the profile tables.
+    Returns True when the emergency stop combination is completed."""
+    # Check for emergency stop combo
+    emergency_buttons = state['emergency_buttons']
+    if event.type == pygame.JOYBUTTONDOWN or event.type == pygame.JOYBUTTONUP:
+        if event.button == EMERGENCY_BUTTONS[0]:
+            emergency_buttons['L1'] = event.type == pygame.JOYBUTTONDOWN
+        elif event.button == EMERGENCY_BUTTONS[1]:
+            emergency_buttons['R1'] = event.type == pygame.JOYBUTTONDOWN
+    elif event.type == pygame.JOYAXISMOTION:
+        if event.axis == EMERGENCY_TRIGGER_AXES[0]:
+            emergency_buttons['L2'] = event.value > EMERGENCY_TRIGGER_THRESHOLD
+        elif event.axis == EMERGENCY_TRIGGER_AXES[1]:
+            emergency_buttons['R2'] = event.value > EMERGENCY_TRIGGER_THRESHOLD
+    
+    # Check if all emergency buttons are pressed
+    if all(emergency_buttons.values()):
+        return True
+    
+    # Normal input handling through the controller's compiled profile tables
+    profile = state['profile']
+    if event.type == pygame.JOYAXISMOTION:
+        entry = profile['axes'][event.axis] if event.axis < MAX_AXES else None
+        if entry:
+            entry[0](entry[1], event.value, state, overlays)
+    
+    elif event.type == pygame.JOYBUTTONDOWN:
+        if profile['gyro'] and event.button == profile['gyro']['ratchet']:
+            state['gyro_ratchet'] = True
+        entry = profile['button_down'][event.button] if event.button < MAX_BUTTONS else None
+        if entry:
+            action, overlay = entry
+            if action:
+                output_backend.send(action)
+            release = profile['button_up'][event.button][0]
+            if release:
+                state['held_releases'][('button', event.button)] = release
+            if profile['macros'][event.button]:
+                start_macro(profile['macros'][event.button], state, event.button)
+            show_overlay(overlays, overlay, True)
+    
+    elif event.type == pygame.JOYBUTTONUP:
+        if profile['gyro'] and event.button == profile['gyro']['ratchet']:
+            state['gyro_ratchet'] = False
+        entry = profile['button_up'][event.button] if event.button < MAX_BUTTONS else None
+        if entry:
+            release = state['held_releases'].pop(('button', event.button), None)
+            if release:
+                output_backend.send(release)
+            macro = profile['macros'][event.button]
+            if macro and macro['cancel_on_release']:
+                for run in state['macro_runs'].pop(event.button, ()):
+                    run.cancel()
+            show_overlay(overlays, entry[1], False)
+    return False
+
+# Compiled mapping profile used by the controller loop and the mappings list
+active_profile = load_active_profile()
+
+# Connected controllers by SDL instance id, and the one whose overlays the window shows
+devices = {}
+selected_device = None
+device_profile_cache = {}
+
+# Reconnect state: player -> {'guid', 'name', 'since'} for controllers that disappeared,
+# and the measured time until each one came back
+reconnecting = {}
+reconnect_times = deque(maxlen=20)
+
+def profile_path_for_player(player):
+    """Returns the absolute path of the profile file a player slot uses"""
+    return os.path.abspath(focus_profile_path or DEVICE_PROFILES.get(player) or active_profile_path)
+
+def profile_for_player(player):
+    """Returns the compiled profile for a player slot. Profile files are compiled at startup,
+    so connecting a controller never reads a file on the controller loop."""
+    path = profile_path_for_player(player)
+    if path == os.path.abspath(active_profile_path):
+        return active_profile
+    return device_profile_cache.get(path, active_profile)
+
+def register_device(instance_id, name, joystick=None, guid=None, reader=None):
+    """Creates the state, profile and overlays for a controller and starts routing its events.
+    A controller whose GUID matches one waiting to reconnect gets that player number back."""
+    global selected_device
+    player = None
+    reconnect_time = None
+    if guid is not None:
+        waiting = [number for number, slot in reconnecting.items() if slot['guid'] == guid]
+        if waiting:
+            # Identical controllers share a GUID, so the longest-waiting player is matched first
+            player = min(waiting, key=lambda number: reconnecting[number]['since'])
+            reconnect_time = time.perf_counter() - reconnecting.pop(player)['since']
+            reconnect_times.append(reconnect_time)
+    if player is None:
+        used = {device['player'] for device in devices.values()} | set(reconnecting)
+        player = 1
+        while player in used:
+            player += 1
+    profile = profile_for_player(player)
+    state = create_controller_state(profile)
+    device = {
+        'instance_id': instance_id,
+        'name': name,
+        'guid': guid,
+        'joystick': joystick,
+        'player': player,
+        'profile_path': profile_path_for_player(player),
+        'state': state,
+        'overlays': OverlayState(),
+        # Mouse motion from the native reports, for controllers read through hidraw
+        'motion_sources': [GyroAim(reader, state), TouchpadMouse(reader, state)] if reader else []
+    }
+    devices[instance_id] = device
+    if mouse_emitter:
+        mouse_emitter.attach(device['state']['mouse_state'])
+        for source in device['motion_sources']:
+            mouse_emitter.attach_motion(source)
+    if selected_device not in devices:
+        selected_device = instance_id
+    if reconnect_time is None:
+        add_log(f"Controller {player} connected: {name} (instance {instance_id}, profile '{profile['name']}')")
+    else:
+        add_log(f"Controller {player} reconnected after {reconnect_time * 1000:.0f} ms: {name}")
+    update_device_status()
+    return device
+
+def open_device(device_index):
+    """Opens the joystick at a device index, or returns its record if it is already open"""
+    if hid_input:
+        # Native reports carry the reader's instance id as the device index
+        reader = hid_input.readers.get(device_index)
+        if reader is None or device_index in devices:
+            return devices.get(device_index)
+        return register_device(device_index, reader.name, guid=reader.guid, reader=reader)
+    joystick = pygame.joystick.Joystick(device_index)
+    joystick.init()
+    instance_id = joystick.get_instance_id()
+    if instance_id in devices:
+        return devices[instance_id]
+    name = joystick.get_name()
+    if "DualSense" not in name:
+        add_log(f"Warning: Controller detected is not DualSense: {name}", level=WARNING)
+    return register_device(instance_id, name, joystick, joystick.get_guid())
+
+def close_device(instance_id):
+    """Releases everything a controller holds and stops routing its events"""
+    global selected_device
+    device = devices.pop(instance_id, None)
+    if device is None:
+        return None
+    release_held_inputs(device['state'])
+    device['overlays'].clear()
+    if mouse_emitter:
+        mouse_emitter.detach(device['state']['mouse_state'])
+        for source in device['motion_sources']:
+            mouse_emitter.detach_motion(source)
+    if selected_device == instance_id:
+        selected_device = min(devices, key=lambda key: devices[key]['player']) if devices else None
+    if device['guid'] is not None:
+        reconnecting[device['player']] = {'guid': device['guid'], 'name': device['name'],
+                                          'since': time.perf_counter()}
+    add_log(f"Controller {device['player']} disconnected: {device['name']}")
+    update_device_status()
+    return device
+
+def expire_reconnecting(now):
+    """Gives up on controllers that have not come back within RECONNECT_TIMEOUT"""
+    for player, slot in list(reconnecting.items()):
+        if now - slot['since'] > RECONNECT_TIMEOUT:
+            del reconnecting[player]
+            add_log(f"Controller {player} did not reconnect within {RECONNECT_TIMEOUT} s")
+            update_device_status()
+
+def get_reconnect_stats():
+    """Returns the number of measured reconnects and their last/mean/max time in milliseconds"""
+    samples = list(reconnect_times)
+    if not samples:
+        return {'count': 0, 'last_ms': 0.0, 'mean_ms': 0.0, 'max_ms': 0.0}
+    return {
+        'count': len(samples),
+        'last_ms': samples[-1] * 1000,
+        'mean_ms': sum(samples) / len(samples) * 1000,
+        'max_ms': max(samples) * 1000
+    }
+
+def update_device_status():
+    if suspended:
+        set_controller_status("Output suspended: the game window does not have focus")
+    elif reconnecting:
+        players = ", ".join(str(player) for player in sorted(reconnecting))
+        set_controller_status(f"Controller {players} disconnected. Waiting for reconnection...")
+    elif not devices:
+        set_controller_status("Waiting for controller connection...")
+    elif len(devices) == 1:
+        set_controller_status(f"Connected: {next(iter(devices.values()))['name']}")
+    else:
+        set_controller_status(f"Connected: {len(devices)} controllers")
+
+class ProfileWatcher:
+    """Watches the profile files and parses and compiles changed ones on its own thread.
+    The controller loop only picks up finished profiles between ticks, so it never touches a file."""
+
+    IN_CLOSE_WRITE = 0x08
+    IN_MOVED_TO = 0x80
+    EVENT_HEADER = struct.Struct('iIII')  # watch descriptor, mask, cookie, name length
+
+    def __init__(self):
+        self.paths = set()
+        # Path -> compiled profile; the watcher thread only adds entries and the controller loop only takes them
+        self.ready = {}
+        self.stamps = {}
+        self.directories = {}
+        self.method = None
+        self.stopped = Event()
+        self.thread = None
+
+    def start(self, paths):
+        if self.thread:
+            return
+        self.paths = {os.path.abspath(path) for path in paths}
+        self.stamps = {path: self.stamp(path) for path in self.paths}
+        self.stopped.clear()
+        self.thread = Thread(target=self.run, name="Profile watcher", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join(timeout=2)
+            self.thread = None
+
+    @staticmethod
+    def stamp(path):
+        """Modification time and size of a file, or None if it doesn't exist"""
+        try:
+            info = os.stat(path)
+        except OSError:
+            return None
+        return info.st_mtime_ns, info.st_size
+
+    def take(self):
+        """Removes and returns the profiles compiled since the last call"""
+        taken = {}
+        while self.ready:
+            path, profile = self.ready.popitem()
+            taken[path] = profile
+        return taken
+
+    def reload(self, path):
+        """Parses and compiles a changed profile; an invalid one is logged and the current one kept"""
+        stamp = self.stamp(path)
+        if stamp is None or stamp == self.stamps.get(path):
+            return
+        self.stamps[path] = stamp
+        try:
+            self.ready[path] = compile_profile(load_profile(path))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            add_log(f"Invalid profile {path}: {e}, keeping the current profile", level=WARNING)
+
+    def open_inotify(self):
+        """Returns an inotify descriptor watching the directory of every profile"""
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is Linux only")
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories = {}
+        for directory in {os.path.dirname(path) for path in self.paths}:
+            # The directory is watched because editors often save by renaming a new file over the profile
+            wd = libc.inotify_add_watch(fd, os.fsencode(directory), self.IN_CLOSE_WRITE | self.IN_MOVED_TO)
+            if wd < 0:
+                error = ctypes.get_errno()
+                os.close(fd)
+                raise OSError(error, os.strerror(error), directory)
+            self.directories[wd] = directory
+        return fd
+
+    def read_changes(self, fd):
+        """Returns the watched paths named by the inotify events waiting on fd"""
+        changed = set()
+        try:
+            data = os.read(fd, 65536)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            path = os.path.join(self.directories.get(wd, ''), name)
+            if path in self.paths:
+                changed.add(path)
+        return changed
+
+    def run(self):
+        try:
+            fd = self.open_inotify()
+        except (OSError, AttributeError) as e:
+            self.method = "polling"
+            add_log(f"Watching profiles by polling every {PROFILE_POLL_INTERVAL:g} s ({e})")
+            self.run_polling()
+            return
+        self.method = "inotify"
+        add_log(f"Watching {len(self.paths)} profile file(s) for changes")
+        try:
+            while not self.stopped.is_set():
+                # The timeout only bounds how long stop() waits; the thread sleeps in select between changes
+                if not select.select([fd], [], [], 0.5)[0]:
+                    continue
+                changed = self.read_changes(fd)
+                # Editors can write a file in several steps; reload once they are done
+                if self.stopped.wait(PROFILE_RELOAD_DELAY):
+                    break
+                changed |= self.read_changes(fd)
+                for path in changed:
+                    self.reload(path)
+        finally:
+            os.close(fd)
+
+    def run_polling(self):
+        while not self.stopped.wait(PROFILE_POLL_INTERVAL):
+            changed = [path for path in self.paths if self.stamp(path) != self.stamps.get(path)]
+            if changed and not self.stopped.wait(PROFILE_RELOAD_DELAY):
+                for path in changed:
+                    self.reload(path)
+
+profile_watcher = ProfileWatcher()
+
+def apply_reloaded_profiles(profiles):
+    """Swaps reloaded profiles in between ticks. Controllers on a changed profile release
+    everything they hold first, so nothing stays pressed by a binding that no longer exists."""
+    global active_profile
+    for path, profile in profiles.items():
+        if path == os.path.abspath(active_profile_path):
+            active_profile = profile
+        if path in device_profile_cache:
+            device_profile_cache[path] = profile
+        players = []
+        for device in devices.values():
+            if device['profile_path'] == path:
+                release_held_inputs(device['state'])
+                device['state']['profile'] = profile
+                players.append(str(device['player']))
+        add_log(f"Reloaded profile '{profile['name']}' from {path}"
+                + (f" for controller(s) {', '.join(players)}" if players else ""))
+
+class FocusWatcher:
+    """Follows the X11 active window through PropertyNotify events on its own thread. The window is only
+    looked up when focus or its title changes; the controller loop reads the cached target."""
+
+    PROPERTY_NOTIFY = 28
+    PROPERTY_CHANGE_MASK = 1 << 22
+    XA_WINDOW = 33
+
+    def __init__(self):
+        # Key of FOCUS_WINDOWS matching the active window, or None; changed is set whenever it is updated
+        self.target = None
+        self.title = ""
+        self.changed = False
+        self.active = 0
+        self.available = False
+        self.display = None
+        self.error_handler = None
+        self.previous_error_handler = None
+        self.stopped = Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread:
+            return
+        self.stopped.clear()
+        self.thread = Thread(target=self.run, name="Focus watcher", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join(timeout=2)
+            self.thread = None
+
+    def open_display(self):
+        import ctypes
+        import ctypes.util
+        xlib = ctypes.CDLL(ctypes.util.find_library('X11') or 'libX11.so.6')
+        # No XInitThreads: Tk has used Xlib before this thread starts, and this display is only used here
+        xlib.XOpenDisplay.restype = ctypes.c_void_p
+        xlib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        xlib.XDefaultRootWindow.restype = ctypes.c_ulong
+        xlib.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+        xlib.XInternAtom.restype = ctypes.c_ulong
+        xlib.XInternAtom.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_int]
+        xlib.XSelectInput.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.c_long]
+        xlib.XGetWindowProperty.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.c_ulong, ctypes.c_long,
+                                            ctypes.c_long, ctypes.c_int, ctypes.c_ulong,
+                                            ctypes.POINTER(ctypes.c_ulong), ctypes.POINTER(ctypes.c_int),
+                                            ctypes.POINTER(ctypes.c_ulong), ctypes.POINTER(ctypes.c_ulong),
+                                            ctypes.POINTER(ctypes.c_void_p)]
+        xlib.XFree.argtypes = [ctypes.c_void_p]
+        xlib.XPending.argtypes = [ctypes.c_void_p]
+        xlib.XNextEvent.argtypes = [ctypes.c_void_p, ctypes.c_void_p]
+        xlib.XConnectionNumber.argtypes = [ctypes.c_void_p]
+        xlib.XSetErrorHandler.restype = ctypes.c_void_p
+        xlib.XSetErrorHandler.argtypes = [ctypes.c_void_p]
+        xlib.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        display = xlib.XOpenDisplay(None)
+        if not display:
+            raise OSError("Cannot open X display")
+        self.display = display
+        if self.error_handler is None:
+            # Errors on this display are ignored, e.g. when a window closes while its title is read (the default
+            # handler would exit the program). The handler is process-wide, so other displays' errors, such as
+            # Tk's, go to the handler that was installed before. It is installed once and never swapped out.
+            handler_type = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p)
+
+            def handle_error(error_display, error):
+                previous = self.previous_error_handler
+                if error_display == self.display or previous is None:
+                    return 0
+                return previous(error_display, error)
+
+            self.error_handler = handler_type(handle_error)
+            previous = xlib.XSetErrorHandler(self.error_handler)
+            self.previous_error_handler = handler_type(previous) if previous else None
+        self.ctypes = ctypes
+        self.xlib = xlib
+        self.root = xlib.XDefaultRootWindow(display)
+        self.atoms = {name: xlib.XInternAtom(display, name.encode(), False)
+                      for name in ('_NET_ACTIVE_WINDOW', '_NET_WM_NAME', 'WM_NAME', 'WM_CLASS')}
+        xlib.XSelectInput(display, self.root, self.PROPERTY_CHANGE_MASK)
+
+    def get_property(self, window, name, as_windows=False):
+        """Reads a window property as bytes, or as a list of window ids"""
+        ctypes = self.ctypes
+        actual_type = ctypes.c_ulong()
+        actual_format = ctypes.c_int()
+        items = ctypes.c_ulong()
+        remaining = ctypes.c_ulong()
+        data = ctypes.c_void_p()
+        status = self.xlib.XGetWindowProperty(
+            self.display, window, self.atoms[name], 0, 1024, False,
+            self.XA_WINDOW if as_windows else 0,  # 0 is AnyPropertyType
+            ctypes.byref(actual_type), ctypes.byref(actual_format), ctypes.byref(items),
+            ctypes.byref(remaining), ctypes.byref(data))
+        if status != 0 or not data.value:
+            return None
+        try:
+            if as_windows:
+                # Format 32 properties are returned as C longs
+                return ctypes.cast(data, ctypes.POINTER(ctypes.c_ulong))[:items.value]
+            return ctypes.string_at(data, items.value)
+        finally:
+            self.xlib.XFree(data)
+
+    def update_active(self):
+        """Re-reads _NET_ACTIVE_WINDOW and follows title changes of the new window"""
+        windows = self.get_property(self.root, '_NET_ACTIVE_WINDOW', as_windows=True)
+        window = windows[0] if windows else 0
+        if window != self.active:
+            if self.active:
+                self.xlib.XSelectInput(self.display, self.active, 0)
+            if window:
+                # Browser games share one window with other tabs, so its title is watched too
+                self.xlib.XSelectInput(self.display, window, self.PROPERTY_CHANGE_MASK)
+            self.active = window
+        self.update_target()
+
+    def update_target(self):
+        title = b""
+        window_class = b""
+        if self.active:
+            title = self.get_property(self.active, '_NET_WM_NAME') or self.get_property(self.active, 'WM_NAME') or b""
+            window_class = self.get_property(self.active, 'WM_CLASS') or b""
+        title = title.decode('utf-8', 'replace')
+        text = (title + " " + window_class.replace(b"\0", b" ").decode('utf-8', 'replace')).lower()
+        target = next((pattern for pattern in FOCUS_WINDOWS if pattern.lower() in text), None)
+        self.title = title
+        if target != self.target or not self.available:
+            self.target = target
+            self.available = True
+            self.changed = True
+
+    def run(self):
+        try:
+            self.open_display()
+        except (OSError, AttributeError) as e:
+            add_log(f"Cannot watch the active window ({e}), output is not suspended when the game loses focus",
+                    level=WARNING)
+            return
+        add_log("Watching the active window for " + ", ".join(f"'{pattern}'" for pattern in FOCUS_WINDOWS))
+        ctypes = self.ctypes
+        xlib = self.xlib
+        event = (ctypes.c_ulong * 24)()  # Large enough for any XEvent
+        event_type = ctypes.cast(event, ctypes.POINTER(ctypes.c_int)).contents
+        names = (self.atoms['_NET_WM_NAME'], self.atoms['WM_NAME'])
+        fd = xlib.XConnectionNumber(self.display)
+        try:
+            self.update_active()
+            while not self.stopped.is_set():
+                if not xlib.XPending(self.display):
+                    # The timeout only bounds how long stop() waits
+                    select.select([fd], [], [], 0.5)
+                    continue
+                xlib.XNextEvent(self.display, event)
+                if event_type.value != self.PROPERTY_NOTIFY:
+                    continue
+                # XPropertyEvent: type, serial, send_event, display, window, atom, ... each padded to a long
+                window, atom = event[4], event[5]
+                if window == self.root and atom == self.atoms['_NET_ACTIVE_WINDOW']:
+                    self.update_active()
+                elif window == self.active and atom in names:
+                    self.update_target()
+        finally:
+            xlib.XCloseDisplay(self.display)
+            self.display = None
+
+focus_watcher = FocusWatcher()
+
+# True while output is suspended because no window from FOCUS_WINDOWS has focus
+suspended = False
+resume_tick_rate = TICK_RATE
+
+def switch_device_profiles():
+    """Gives every controller the profile its player slot now maps to, releasing what it held under the old one"""
+    for device in devices.values():
+        path = profile_path_for_player(device['player'])
+        if path != device['profile_path']:
+            release_held_inputs(device['state'])
+            device['profile_path'] = path
+            device['state']['profile'] = profile_for_player(device['player'])
+            add_log(f"Controller {device['player']} switched to profile '{device['state']['profile']['name']}'")
+
+def set_suspended(value):
+    """Stops all output and drops the controller loop to SUSPENDED_TICK_RATE, or resumes"""
+    global suspended, resume_tick_rate
+    if value == suspended:
+        return
+    suspended = value
+    if value:
+        for device in devices.values():
+            release_held_inputs(device['state'])
+        if mouse_emitter:
+            mouse_emitter.stop()
+        resume_tick_rate = tick_scheduler.rate
+        tick_scheduler.set_rate(SUSPENDED_TICK_RATE)
+    else:
+        tick_scheduler.set_rate(resume_tick_rate)
+        if mouse_emitter:
+            mouse_emitter.start()
+    update_device_status()
+
+def apply_focus(target, title):
+    """Switches profiles for the focused window, or suspends output when it isn't one from FOCUS_WINDOWS"""
+    global focus_profile_path
+    if target is None:
+        if not suspended:
+            add_log(f"Suspending output, focused window: '{title}'")
+            set_suspended(True)
+        return
+    focus_profile_path = FOCUS_WINDOWS[target]
+    switch_device_profiles()
+    if suspended:
+        add_log(f"Resuming output, focused window: '{title}'")
+        set_suspended(False)
 
 def create_button_overlay(canvas, x, y, width, height, tag, color='#00ff00', opacity='gray50'):
     """Creates a semi-transparent button overlay"""
@@ -199,10 +2738,27 @@ def update_button_state(canvas, tag, active):
             state='normal'
         )
         overlay['active'] = active
-        canvas.update_idletasks()
+
+def drain_overlay_updates(canvas, drawn=None):
+    """Redraws only the overlays of the selected controller that changed since the last GUI frame"""
+    device = devices.get(selected_device)
+    overlays = device['overlays'] if device else None
+    if overlays is None:
+        changes = [(tag, False) for tag in button_overlays] if drawn is not None else []
+    elif overlays is drawn:
+        changes = overlays.changes()
+    else:
+        # Another controller was selected: redraw everything from its state
+        changes = overlays.snapshot(button_overlays)
+    gui_queue_depth.observe(len(changes))
+    for tag, active in changes:
+        update_button_state(canvas, tag, active)
+    if running:
+        canvas.after(int(1000 / GUI_FRAME_RATE), drain_overlay_updates, canvas, overlays)
 
 def copy_to_clipboard(root, text):
     """Copy text to clipboard and show brief confirmation"""
+    import tkinter as tk
     root.clipboard_clear()
     root.clipboard_append(text)
     
@@ -221,6 +2777,10 @@ def copy_to_clipboard(root, text):
 
 def create_status_window():
     """Creates a status window with DualSense image"""
+    import tkinter as tk
+    from tkinter import ttk
+    import webbrowser
+    
     root = tk.Tk()
     root.title("DualSense Controller")
     
@@ -274,73 +2834,75 @@ def create_status_window():
     status_label = ttk.Label(top_frame, text="Status: Initializing...", font=("Arial", 10, "bold"))
     status_label.pack(side=tk.LEFT, pady=5)
     
+    # Selector for which controller's buttons the overlays show
+    device_choice = tk.StringVar()
+    device_selector = ttk.Combobox(top_frame, textvariable=device_choice, state='readonly', width=32)
+    device_selector.pack(side=tk.RIGHT, pady=5)
+    ttk.Label(top_frame, text="Show controller:", font=("Arial", 9)).pack(side=tk.RIGHT, padx=5)
+    device_labels = {}
+    
+    def select_device(event=None):
+        global selected_device
+        selected_device = device_labels.get(device_choice.get(), selected_device)
+    
+    device_selector.bind("<<ComboboxSelected>>", select_device)
+    
     # Frame for the image
     image_frame = ttk.Frame(main_frame)
     image_frame.pack(fill=tk.BOTH, expand=False)
     
-    # Load DualSense image directly from embedded data
-    add_log("Attempting to load embedded DualSense image")
-    try:
-        # Try to load the embedded image first
-        image = get_embedded_image()
-        
-        if image:
-            add_log("Processing the loaded image")
-            image_width = int(window_width * 0.6)
-            wpercent = image_width / float(image.size[0])
-            hsize = int(float(image.size[1]) * float(wpercent))
-            image = image.resize((image_width, hsize), Image.Resampling.LANCZOS)
-            photo = ImageTk.PhotoImage(image)
-            
-            # Create canvas for image and overlays
-            canvas = tk.Canvas(image_frame, width=image.width, height=image.height, bg='#734373', highlightthickness=0)
-            canvas.pack(pady=5)
-            
-            # Display the DualSense image
-            canvas.create_image(0, 0, image=photo, anchor="nw")
-            canvas._image = photo
-        else:
-            raise Exception("Failed to load image from any source")
-    except Exception as e:
-        add_log(f"Error processing image: {e}")
-        # Fallback to a blank canvas if image loading fails
-        canvas = tk.Canvas(image_frame, width=480, height=300, bg='#734373', highlightthickness=0)
-        canvas.pack(pady=5)
-        canvas.create_text(240, 150, text="Image not found", fill="white", font=("Arial", 14))
+    # Canvas for the image and overlays; the image itself is loaded once the window is up
+    image_width = int(window_width * 0.6)
+    canvas = tk.Canvas(image_frame, width=image_width, height=image_width, bg='#734373', highlightthickness=0)
+    canvas.pack(pady=5)
+    loading_text = canvas.create_text(image_width // 2, image_width // 2, text="Loading controller image...",
+                                      fill="white", font=("Arial", 14))
+    
+    def show_controller_image():
+        """Loads the DualSense image (cached after the first launch) and places it under the overlays"""
+        add_log("Attempting to load embedded DualSense image")
+        try:
+            photo = load_controller_photo(image_width)
+            if not photo:
+                raise Exception("Failed to load image from any source")
+        except Exception as e:
+            add_log(f"Error processing image: {e}", level=ERROR)
+            canvas.itemconfig(loading_text, text="Image not found")
+            return
+        canvas.delete(loading_text)
+        canvas.config(height=photo.height())
+        image_item = canvas.create_image(0, 0, image=photo, anchor="nw")
+        canvas.tag_lower(image_item)
+        canvas._image = photo
+    
+    root.after(50, show_controller_image)
     
     # Frame for button mappings
     mappings_frame = ttk.LabelFrame(main_frame, text="Button Mappings", padding=10, style='TLabelframe')
     mappings_frame.pack(fill=tk.X, expand=False, pady=10)
     
-    # Grid for mappings in 3 columns
-    mappings = [
-        ("Left Analog", "WASD Movement"),
-        ("Right Analog", "Mouse Movement"),
-        ("L1", "Enter (Chat/Confirm)"),
-        ("D-Pad Left", "R (Mount/Unmount)"),
-        ("D-Pad Right", "M (Map)"),
-        ("D-Pad Down", "C (Character)"),
-        ("D-Pad Up", "I (Inventory)"),
-        ("L2", "E (Interact)"),
-        ("R2", "Left Click"),
-        ("X (Blue)", "Key 3"),
-        ("Circle (Red)", "Key 4"),
-        ("Square (Pink)", "Key 2"),
-        ("Triangle (Green)", "Key 1")
-    ]
+    # Grid for mappings in 3 columns, generated from the shown controller's profile
+    shown_mappings = []
     
-    # Create three columns for better organization
-    col_size = len(mappings) // 3 + (1 if len(mappings) % 3 else 0)
-    for i, (button, action) in enumerate(mappings):
-        row = i % col_size
-        col = i // col_size * 2
-        
-        ttk.Label(mappings_frame, text=button + ":", font=("Arial", 9, "bold")).grid(
-            row=row, column=col, sticky="e", padx=5, pady=2
-        )
-        ttk.Label(mappings_frame, text=action, font=("Arial", 9)).grid(
-            row=row, column=col+1, sticky="w", padx=5, pady=2
-        )
+    def show_mappings(mappings):
+        """Rebuilds the grid, e.g. after the profile was reloaded or switched"""
+        for label in mappings_frame.winfo_children():
+            label.destroy()
+        shown_mappings[:] = [mappings]
+        # Create three columns for better organization
+        col_size = max(1, len(mappings) // 3 + (1 if len(mappings) % 3 else 0))
+        for i, (button, action) in enumerate(mappings):
+            row = i % col_size
+            col = i // col_size * 2
+            
+            ttk.Label(mappings_frame, text=button + ":", font=("Arial", 9, "bold")).grid(
+                row=row, column=col, sticky="e", padx=5, pady=2
+            )
+            ttk.Label(mappings_frame, text=action, font=("Arial", 9)).grid(
+                row=row, column=col+1, sticky="w", padx=5, pady=2
+            )
+    
+    show_mappings(active_profile['mappings'])
     
     # Quit button
     quit_button = tk.Button(main_frame, text="Quit", command=lambda: quit_app(root), **quit_button_style)
@@ -427,32 +2989,62 @@ def create_status_window():
     
     def update_status():
         status_label.config(text=f"Status: {controller_status}")
+        labels = {f"{device['player']}: {device['name']}": instance_id
+                  for instance_id, device in sorted(devices.copy().items(), key=lambda item: item[1]['player'])}
+        if labels != device_labels:
+            device_labels.clear()
+            device_labels.update(labels)
+            device_selector['values'] = list(labels)
+        current = next((label for label, instance_id in labels.items() if instance_id == selected_device), "")
+        if device_choice.get() != current:
+            device_choice.set(current)
+        device = devices.get(selected_device)
+        mappings = (device['state']['profile'] if device else active_profile)['mappings']
+        if mappings is not shown_mappings[0]:
+            show_mappings(mappings)
         if running:
             root.after(100, update_status)
     
     update_status()
+    drain_overlay_updates(canvas)
     root.protocol("WM_DELETE_WINDOW", lambda: quit_app(root))
     return root, canvas
 
-def apply_mouse_acceleration(value):
-    """Applies smooth acceleration to mouse movement"""
-    if abs(value) < 0.3:
-        return value * 0.4
-    elif abs(value) < 0.6:
-        return value * 0.7
-    return (abs(value) ** MOUSE_ACCELERATION) * (1 if value >= 0 else -1)
-
 def show_debug_info():
     """Shows debug information to help diagnose issues"""
+    from tkinter import messagebox
     try:
         # Coletar informações do sistema
         system_info = [
             f"Python version: {sys.version}",
             f"Pygame installed: {'Yes' if 'pygame' in sys.modules else 'No'}",
             f"PyAutoGUI installed: {'Yes' if 'pyautogui' in sys.modules else 'No'}",
+            f"Output backend: {output_backend.name if output_backend else 'None'}",
+            "Controllers: " + (", ".join(f"{device['player']}: {device['name']} (instance {instance_id}, "
+                                         f"profile '{device['state']['profile']['name']}')"
+                                         for instance_id, device in devices.copy().items()) or "none"),
             f"Working directory: {os.getcwd()}",
             f"Has image file: {'Yes' if os.path.exists('Dualsense-PS5.png') else 'No'}",
-            f"Debug log: {debug_log}"
+            "Tick rate: {rate} Hz, ticks: {ticks}, overruns: {overruns}, "
+            "jitter mean/p99/max: {mean_ms:.3f}/{p99_ms:.3f}/{max_ms:.3f} ms".format(**tick_scheduler.get_jitter_stats()),
+            (f"Idle: controller loop {'waiting for input' if idle else 'ticking'}, mouse emitter "
+             f"{'idle' if mouse_emitter and mouse_emitter.idle else 'active'} (after {IDLE_TIMEOUT:g} s without input)"
+             if IDLE_TIMEOUT else "Idle: off"),
+            "Mouse emit rate: {rate} Hz, overruns: {overruns}, "
+            "jitter mean/p99/max: {mean_ms:.3f}/{p99_ms:.3f}/{max_ms:.3f} ms".format(**mouse_emitter.scheduler.get_jitter_stats())
+            if mouse_emitter else "Mouse emitter: not running",
+            (f"Output queue: dropped moves {output_backend.dropped['move']}, dropped presses {output_backend.dropped['press']}"
+             if output_backend else "Output queue: not running"),
+            "Reconnects: {count}, last/mean/max: {last_ms:.0f}/{mean_ms:.0f}/{max_ms:.0f} ms".format(**get_reconnect_stats()),
+            "Timer wheel: {rate} Hz, overruns: {overruns}, "
+            "jitter mean/p99/max: {mean_ms:.3f}/{p99_ms:.3f}/{max_ms:.3f} ms".format(**timer_wheel.scheduler.get_jitter_stats()),
+            *get_stage_summary(),
+            f"Profile watcher: {profile_watcher.method or 'off'}",
+            ("HID input: {controllers} controller(s), {reports} reports, {crc_errors} CRC errors".format(**hid_input.get_stats())
+             if hid_input else "HID input: off (SDL)"),
+            f"Log file: {logger.path or 'not started'}",
+            "Recent log:",
+            *logger.recent(20)
         ]
         
         # Display in messagebox
@@ -460,341 +3052,1049 @@ def show_debug_info():
     except Exception as e:
         messagebox.showerror("Error showing debug info", str(e))
 
-def handle_controller(canvas):
-    global controller_status, running, EMERGENCY_STOP_COMBO, init_timeout
-    
-    try:
-        controller_status = "Initializing DualSense controller..."
-        add_log("Starting controller initialization")
-        
-        try:
-            add_log("Initializing pygame")
-            pygame.init()
-            add_log("Pygame initialized successfully")
-        except Exception as e:
-            add_log(f"Pygame initialization error: {e}")
-            controller_status = f"Error initializing pygame: {e}"
-            return
-        
+# DualSense input reports. USB reports (id 0x01) are 64 bytes. Bluetooth reports (id 0x31) are 78 bytes:
+# one more header byte before the same payload, and a CRC32 at the end.
+DUALSENSE_VENDOR_ID = 0x054C
+DUALSENSE_PRODUCT_IDS = (0x0CE6, 0x0DF2)  # DualSense, DualSense Edge
+HID_USB_REPORT_ID = 0x01
+HID_USB_REPORT_SIZE = 64
+HID_BT_REPORT_ID = 0x31
+HID_BT_REPORT_SIZE = 78
+HID_PAYLOAD_SIZE = 63
+HID_BT_CRC_SEED = zlib.crc32(b'\xa1')  # Bluetooth CRCs start with the 0xA1 input report header
+HID_CRC = struct.Struct('<I')
+# Payload offsets: sticks and triggers 0-5 in AXIS_INDEX order, sequence 6, buttons 7-9,
+# gyro and accelerometer 15-26, sensor timestamp 27-30, two touch points 32-39
+HID_AXES = tuple(range(6))
+HID_BUTTONS = 7
+HID_MOTION_OFFSET = 15
+HID_MOTION = struct.Struct('<3h3hI')  # gyro x/y/z, accelerometer x/y/z, timestamp in 1/3 microseconds
+HID_TOUCH_OFFSET = 32
+HID_TOUCH = struct.Struct('<Ix8B')  # sensor timestamp, then two 4-byte touch points; read from payload offset 27
+HID_TIMESTAMP_RATE = 3000000  # Sensor timestamp ticks per second
+# Raw motion units for the IMU's +-2000 deg/s and +-4 g ranges, used when a controller has no calibration
+GYRO_DEGREES_PER_COUNT = 2000 / 32768
+ACCEL_G_PER_COUNT = 1 / 8192
+HID_DPAD = (('dpad_up',), ('dpad_up', 'dpad_right'), ('dpad_right',), ('dpad_down', 'dpad_right'),
+            ('dpad_down',), ('dpad_down', 'dpad_left'), ('dpad_left',), ('dpad_up', 'dpad_left'))
+HID_BUTTON_BITS = (  # (button byte, bit, button)
+    (0, 0x10, 'square'), (0, 0x20, 'cross'), (0, 0x40, 'circle'), (0, 0x80, 'triangle'),
+    (1, 0x01, 'l1'), (1, 0x02, 'r1'), (1, 0x10, 'create'), (1, 0x20, 'options'), (1, 0x40, 'l3'), (1, 0x80, 'r3'),
+    (2, 0x01, 'ps'), (2, 0x02, 'touchpad'), (2, 0x04, 'mute')
+)
+
+def build_hid_button_masks():
+    """Lookup tables from each of the three button bytes to a mask of BUTTON_INDEX bits"""
+    masks = [[0] * 256 for _ in range(3)]
+    for value in range(256):
+        for byte, bit, name in HID_BUTTON_BITS:
+            if value & bit:
+                masks[byte][value] |= 1 << BUTTON_INDEX[name]
+        # The low nibble of the first byte is the d-pad as a hat, 8 when released
+        if value & 0x0F < 8:
+            for name in HID_DPAD[value & 0x0F]:
+                masks[0][value] |= 1 << BUTTON_INDEX[name]
+    return masks
+
+HID_BUTTON_MASKS = build_hid_button_masks()
+# Axis bytes scaled the way SDL reports them, so profiles behave the same with either input backend
+HID_AXIS_VALUES = tuple(max(-1.0, (value * 257 - 32768) / 32767) for value in range(256))
+
+class HidReader:
+    """Reads one DualSense's input reports on its own thread, at the controller's own rate,
+    and turns the changes into joystick events. Parsing reuses one buffer and views made up front."""
+
+    def __init__(self, path, instance_id, name, guid, events, on_close, recorded=False, record_dir=None, wakeup=None):
+        self.path = path
+        self.instance_id = instance_id
+        self.name = name
+        self.guid = guid
+        self.events = events
+        self.on_close = on_close
+        # Set whenever events are waiting, for a controller loop that is idling
+        self.wakeup = wakeup or Event()
+        self.recorded = recorded
+        self.record_dir = record_dir
+        self.buffer = bytearray(HID_BT_REPORT_SIZE)
+        view = memoryview(self.buffer)
+        self.usb_report = view[:HID_USB_REPORT_SIZE]
+        self.bt_report = view[:HID_BT_REPORT_SIZE]
+        self.usb_payload = view[1:1 + HID_PAYLOAD_SIZE]
+        self.bt_payload = view[2:2 + HID_PAYLOAD_SIZE]
+        self.bt_signed = view[:HID_BT_REPORT_SIZE - HID_CRC.size]
+        self.usb_motion = view[1 + HID_MOTION_OFFSET:1 + HID_MOTION_OFFSET + HID_MOTION.size]
+        self.bt_motion = view[2 + HID_MOTION_OFFSET:2 + HID_MOTION_OFFSET + HID_MOTION.size]
+        # Every report's motion sample goes into a ring; motion_count is only advanced once a sample is complete
+        self.motion_ring = bytearray(HID_MOTION.size * HID_MOTION_RING)
+        self.motion_count = 0
+        self.report_id = view[:1]
+        self.usb_rest = view[1:HID_USB_REPORT_SIZE]
+        self.bt_rest = view[1:HID_BT_REPORT_SIZE]
+        # Payload of the last accepted report, read by consumers of motion and touch data
+        self.report = bytearray(HID_PAYLOAD_SIZE)
+        self.report[0:4] = b'\x80\x80\x80\x80'
+        self.report[HID_BUTTONS] = 0x08
+        self.buttons = 0
+        self.reports = 0
+        self.crc_errors = 0
+        self.calibration = None
+        self.file = None
+        self.record = None
+        self.thread = None
+        self.running = False
+
+    def parse(self, size):
+        """Turns the report in the read buffer into events. Returns False if it isn't a full input report."""
+        buffer = self.buffer
+        if buffer[0] == HID_USB_REPORT_ID and size == HID_USB_REPORT_SIZE:
+            payload = self.usb_payload
+            motion = self.usb_motion
+        elif buffer[0] == HID_BT_REPORT_ID and size == HID_BT_REPORT_SIZE:
+            if zlib.crc32(self.bt_signed, HID_BT_CRC_SEED) != HID_CRC.unpack_from(buffer, HID_BT_REPORT_SIZE - HID_CRC.size)[0]:
+                self.crc_errors += 1
+                return False
+            payload = self.bt_payload
+            motion = self.bt_motion
+        else:
+            return False
+
+        report = self.report
+        events = self.events
+        instance_id = self.instance_id
+        for axis in HID_AXES:
+            value = payload[axis]
+            if value != report[axis]:
+                events.append(ReplayEvent(pygame.JOYAXISMOTION, instance_id, axis=axis, value=HID_AXIS_VALUES[value]))
+        if (payload[HID_BUTTONS] != report[HID_BUTTONS] or payload[HID_BUTTONS + 1] != report[HID_BUTTONS + 1]
+                or payload[HID_BUTTONS + 2] != report[HID_BUTTONS + 2]):
+            masks = HID_BUTTON_MASKS
+            buttons = (masks[0][payload[HID_BUTTONS]] | masks[1][payload[HID_BUTTONS + 1]]
+                       | masks[2][payload[HID_BUTTONS + 2]])
+            changed = buttons ^ self.buttons
+            self.buttons = buttons
+            while changed:
+                bit = changed & -changed
+                changed ^= bit
+                events.append(ReplayEvent(pygame.JOYBUTTONDOWN if buttons & bit else pygame.JOYBUTTONUP,
+                                          instance_id, button=bit.bit_length() - 1))
+        if events and not self.wakeup.is_set():
+            self.wakeup.set()
+        # A finger touching or leaving the pad wakes an idle mouse emitter, as touches produce no events
+        if mouse_emitter and mouse_emitter.idle and (payload[HID_TOUCH_OFFSET] != report[HID_TOUCH_OFFSET]
+                                                     or payload[HID_TOUCH_OFFSET + 4] != report[HID_TOUCH_OFFSET + 4]):
+            mouse_emitter.wake()
+        # One copy in a single call, so other threads never see half of a report
+        report[:] = payload
+        slot = (self.motion_count & (HID_MOTION_RING - 1)) * HID_MOTION.size
+        self.motion_ring[slot:slot + HID_MOTION.size] = motion
+        self.motion_count += 1
+        self.reports += 1
+        return True
+
+    def read_report(self):
+        """Reads the next report into the buffer and returns its size, 0 at the end"""
+        if not self.recorded:
+            # Each read of a hidraw node returns exactly one report
+            return self.file.readinto(self.buffer) or 0
+        # Recorded files are reports back to back; the report id gives the size of each
+        if not self.file.readinto(self.report_id):
+            return 0
+        if self.buffer[0] == HID_BT_REPORT_ID:
+            return 1 + self.file.readinto(self.bt_rest)
+        return 1 + self.file.readinto(self.usb_rest)
+
+    def enable_full_reports(self):
+        """Reads the calibration feature report, which switches a Bluetooth DualSense from its
+        reduced 0x01 reports to full 0x31 reports"""
+        import fcntl
+        buffer = bytearray(41)
+        buffer[0] = 0x05
+        # HIDIOCGFEATURE(41) from linux/hidraw.h
+        fcntl.ioctl(self.file.fileno(), (3 << 30) | (len(buffer) << 16) | (ord('H') << 8) | 0x07, buffer)
+        self.calibration = bytes(buffer)
+
+    def open(self):
+        """Opens the device or recording; start() then reads it on the reader's thread"""
+        if self.recorded:
+            self.file = open(self.path, 'rb')
+        else:
+            self.file = open(self.path, 'rb', buffering=0)
+            try:
+                self.enable_full_reports()
+            except OSError as e:
+                add_log(f"Could not read calibration from {self.path}: {e}", level=INFO)
+        if self.record_dir:
+            os.makedirs(self.record_dir, exist_ok=True)
+            record_path = os.path.join(self.record_dir, os.path.basename(self.path) + ".bin")
+            self.record = open(record_path, 'ab', buffering=1 << 16)
+
+    def start(self):
+        self.running = True
+        self.thread = Thread(target=self.run, name=f"HID {os.path.basename(self.path)}", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def run(self):
+        # Recorded reports are paced like a controller; a real one paces itself
+        pacer = TickScheduler(HID_REPLAY_RATE) if self.recorded else None
         try:
-            add_log("Initializing pygame joystick")
-            pygame.joystick.init()
-            add_log("Pygame joystick initialized successfully")
-        except Exception as e:
-            add_log(f"Pygame joystick initialization error: {e}")
-            controller_status = f"Error initializing joystick: {e}"
+            while self.running:
+                if pacer:
+                    pacer.wait()
+                size = self.read_report()
+                if not size:
+                    break
+                if self.parse(size) and self.record:
+                    self.record.write(self.bt_report if size == HID_BT_REPORT_SIZE else self.usb_report)
+        except OSError as e:
+            if self.running:
+                add_log(f"Lost {self.name} at {self.path}: {e}", level=INFO)
+        finally:
+            self.file.close()
+            if self.record:
+                self.record.close()
+            self.events.append(ReplayEvent(pygame.JOYDEVICEREMOVED, self.instance_id))
+            self.wakeup.set()
+            self.on_close(self)
+
+def parse_gyro_calibration(calibration):
+    """Returns per-axis (bias, degrees per count) for pitch, yaw and roll from the 0x05 feature report,
+    or the nominal scale when the report is missing or implausible"""
+    nominal = [(0, GYRO_DEGREES_PER_COUNT)] * 3
+    if not calibration or len(calibration) < 23:
+        return nominal
+    # Biases, then the raw reading at +-speed for each axis, then the speed in degrees per second
+    values = struct.unpack_from('<11h', calibration, 1)
+    biases = values[0:3]
+    plus = values[3:9:2]
+    minus = values[4:9:2]
+    speed_2x = values[9] + values[10]
+    axes = []
+    for bias, high, low in zip(biases, plus, minus):
+        if high - low <= 0:
+            return nominal
+        scale = speed_2x / (high - low)
+        # Every DualSense is close to the nominal range; anything far off is a misread report
+        if not GYRO_DEGREES_PER_COUNT / 2 < scale < GYRO_DEGREES_PER_COUNT * 2:
+            return nominal
+        axes.append((bias, scale))
+    return axes
+
+class GyroAim:
+    """Turns a controller's gyro samples into mouse motion. Runs on the mouse emitter thread, which
+    takes every sample that arrived since its last update as one batch: sums over the batch are done
+    by array slicing in C, and the bias, curve and sensitivity are applied once per batch."""
+
+    def __init__(self, reader, state):
+        self.reader = reader
+        self.state = state
+        self.calibration = parse_gyro_calibration(reader.calibration)
+        self.consumed = reader.motion_count
+        self.last_timestamp = None
+        self.last_take = None
+        self.samples = array('h')
+        # Learned bias in degrees per second on top of the factory calibration
+        self.bias = [0.0, 0.0, 0.0]
+        self.average = None
+        self.accel_average = None
+        self.still_time = 0.0
+        self.calibrated = False
+
+    def read_batch(self, end, count):
+        """Copies the count samples before sample number end out of the ring into self.samples"""
+        ring = self.reader.motion_ring
+        size = HID_MOTION.size
+        start = (end - count) & (HID_MOTION_RING - 1)
+        end = start + count
+        samples = self.samples
+        del samples[:]
+        if end <= HID_MOTION_RING:
+            samples.frombytes(ring[start * size:end * size])
+        else:
+            samples.frombytes(ring[start * size:])
+            samples.frombytes(ring[:(end - HID_MOTION_RING) * size])
+        if sys.byteorder == "big":
+            samples.byteswap()
+        return samples
+
+    def update_bias(self, gyro, accel, elapsed):
+        """Learns the gyro bias while gyro and accelerometer both stay steady, i.e. the controller is put down"""
+        if self.average is None:
+            self.average = list(gyro)
+            self.accel_average = list(accel)
             return
-        
-        add_log(f"Joystick count: {pygame.joystick.get_count()}")
-        while pygame.joystick.get_count() == 0 and running:
-            controller_status = "Waiting for controller connection..."
-            pygame.joystick.quit()
-            add_log("Reinitializing joystick module")
-            pygame.joystick.init()
-            add_log(f"New joystick count: {pygame.joystick.get_count()}")
-            time.sleep(1)
-        
-        if not running:
-            add_log("Program terminated while waiting for controller")
+        blend = min(1.0, elapsed / 0.5)
+        steady = True
+        for i in range(3):
+            if abs(gyro[i] - self.average[i]) > GYRO_STILL_NOISE or abs(accel[i] - self.accel_average[i]) > GYRO_STILL_ACCEL:
+                steady = False
+            self.average[i] += (gyro[i] - self.average[i]) * blend
+            self.accel_average[i] += (accel[i] - self.accel_average[i]) * blend
+        self.still_time = self.still_time + elapsed if steady else 0.0
+        if self.still_time >= GYRO_CALIBRATION_TIME:
+            for i in range(3):
+                self.bias[i] += (self.average[i] - self.bias[i]) * blend
+            if not self.calibrated:
+                self.calibrated = True
+                add_log("Gyro bias calibrated: {:.2f} {:.2f} {:.2f} deg/s".format(*self.bias), level=DEBUG)
+
+    def take(self):
+        """Processes the samples that arrived since the last call and returns the mouse motion in pixels"""
+        now = time.perf_counter()
+        # One snapshot of the count, so a report arriving meanwhile is left whole for the next batch
+        end = self.reader.motion_count
+        count = end - self.consumed
+        stale = self.last_take is None or now - self.last_take > MOUSE_MAX_STEP
+        self.last_take = now
+        if not count:
+            return 0.0, 0.0
+        self.consumed = end
+        count = min(count, HID_MOTION_RING - 1)
+        samples = self.read_batch(end, count)
+        # Each sample is 8 shorts: gyro x/y/z, accelerometer x/y/z, timestamp low and high halves
+        timestamp = (samples[-2] & 0xFFFF) | (samples[-1] & 0xFFFF) << 16
+        if stale or self.last_timestamp is None:
+            # After a pause (emitter stopped or first batch) the backlog is dropped rather than sent as one jump
+            self.last_timestamp = timestamp
+            return 0.0, 0.0
+        elapsed = ((timestamp - self.last_timestamp) & 0xFFFFFFFF) / HID_TIMESTAMP_RATE
+        self.last_timestamp = timestamp
+        if elapsed <= 0.0:
+            return 0.0, 0.0
+
+        calibration = self.calibration
+        gyro = [(sum(samples[i::8]) / count - calibration[i][0]) * calibration[i][1] for i in range(3)]
+        accel = [sum(samples[i::8]) / count * ACCEL_G_PER_COUNT for i in range(3, 6)]
+        self.update_bias(gyro, accel, elapsed)
+
+        state = self.state
+        settings = state['profile']['gyro']
+        if not settings or state['gyro_ratchet']:
+            return 0.0, 0.0
+        # Yaw moves the cursor sideways and pitch moves it up and down
+        x_speed = -(gyro[1] - self.bias[1]) * settings['invert_x']
+        y_speed = -(gyro[0] - self.bias[0]) * settings['invert_y']
+        speed = math.hypot(x_speed, y_speed)
+        if speed <= settings['deadzone']:
+            return 0.0, 0.0
+        # The curve shapes the rotation speed; direction is kept
+        max_speed = settings['max_speed']
+        shaped = settings['curve'].lookup(speed / max_speed) * max_speed
+        scale = shaped / speed * settings['sensitivity'] * elapsed
+        return x_speed * scale, y_speed * scale
+
+def touch_point(flags, low, middle, high):
+    """Decodes one touch point: bit 7 of flags is set when no finger is down, the rest is the contact id.
+    Returns (contact id, x, y) or None."""
+    if flags & 0x80:
+        return None
+    return flags & 0x7F, low | (middle & 0x0F) << 8, middle >> 4 | high << 4
+
+class TouchpadMouse:
+    """Trackpad mode: one finger moves the cursor, two fingers scroll, and a fast stroke keeps gliding
+    after the finger lifts. Runs on the mouse emitter thread, reading the latest report each update;
+    touch positions are absolute, so updates in between reports lose nothing."""
+
+    def __init__(self, reader, state):
+        self.reader = reader
+        self.state = state
+        self.contact = None  # (contact id, x, y) of the finger moving the cursor
+        self.scroll_contacts = None  # Contact ids and the midpoint of a two-finger scroll
+        self.last_timestamp = None
+        self.last_take = None
+        self.velocity_x = 0.0  # Cursor speed in pixels per second, for flicks
+        self.velocity_y = 0.0
+        self.gliding = False
+        self.scroll_x = 0.0  # Fractions of a wheel click carried to the next update
+        self.scroll_y = 0.0
+
+    def reset(self):
+        self.contact = None
+        self.scroll_contacts = None
+        self.gliding = False
+        self.velocity_x = self.velocity_y = 0.0
+
+    def take(self):
+        """Returns the cursor motion in pixels since the last call, sending any scrolling directly"""
+        now = time.perf_counter()
+        elapsed = now - self.last_take if self.last_take is not None else 0.0
+        self.last_take = now
+        settings = self.state['profile']['touchpad']
+        if not settings or not elapsed or elapsed > MOUSE_MAX_STEP:
+            # Disabled, or resuming after a pause: start tracking afresh
+            self.reset()
+            return 0.0, 0.0
+        timestamp, *touch = HID_TOUCH.unpack_from(self.reader.report, HID_MOTION_OFFSET + 12)
+        first = touch_point(*touch[0:4])
+        second = touch_point(*touch[4:8])
+
+        if first and second:
+            self.contact = None
+            self.gliding = False
+            contacts = (first[0], second[0])
+            middle_x = (first[1] + second[1]) / 2
+            middle_y = (first[2] + second[2]) / 2
+            if self.scroll_contacts and self.scroll_contacts[0] == contacts and settings['scroll']:
+                # Content follows the fingers, as on a phone
+                self.scroll_x -= (middle_x - self.scroll_contacts[1]) * settings['scroll_speed']
+                self.scroll_y += (middle_y - self.scroll_contacts[2]) * settings['scroll_speed']
+                clicks_x = int(self.scroll_x)
+                clicks_y = int(self.scroll_y)
+                if clicks_x or clicks_y:
+                    self.scroll_x -= clicks_x
+                    self.scroll_y -= clicks_y
+                    output_backend.scroll(clicks_x, clicks_y)
+                    output_backend.flush()
+            self.scroll_contacts = (contacts, middle_x, middle_y)
+            return 0.0, 0.0
+        self.scroll_contacts = None
+        self.scroll_x = self.scroll_y = 0.0
+
+        point = first or second
+        if point is None:
+            if self.contact is not None:
+                # The finger just lifted; a fast stroke turns into a glide
+                self.contact = None
+                self.gliding = (settings['flick'] and
+                                math.hypot(self.velocity_x, self.velocity_y) > TOUCHPAD_FLICK_SPEED)
+            if not self.gliding:
+                return 0.0, 0.0
+            decay = math.exp(-TOUCHPAD_FRICTION * elapsed)
+            self.velocity_x *= decay
+            self.velocity_y *= decay
+            if math.hypot(self.velocity_x, self.velocity_y) < TOUCHPAD_FLICK_SPEED / 20:
+                self.gliding = False
+            return self.velocity_x * elapsed, self.velocity_y * elapsed
+
+        self.gliding = False
+        contact = self.contact
+        self.contact = point
+        if contact is None or contact[0] != point[0]:
+            # A new touch only sets the starting point
+            self.last_timestamp = timestamp
+            self.velocity_x = self.velocity_y = 0.0
+            return 0.0, 0.0
+        if timestamp == self.last_timestamp:
+            return 0.0, 0.0
+        report_time = ((timestamp - self.last_timestamp) & 0xFFFFFFFF) / HID_TIMESTAMP_RATE
+        self.last_timestamp = timestamp
+        dx = point[1] - contact[1]
+        dy = point[2] - contact[2]
+        distance = math.hypot(dx, dy)
+        if not distance or report_time <= 0.0:
+            self.velocity_x = self.velocity_y = 0.0
+            return 0.0, 0.0
+        # The curve turns finger speed into gain, so slow strokes are precise and fast ones cover the screen
+        speed = distance / report_time
+        max_speed = settings['max_speed']
+        gain = settings['curve'].lookup(speed / max_speed) * max_speed / speed * settings['sensitivity']
+        x_pixels = dx * gain
+        y_pixels = dy * gain
+        # Smoothed over the last few reports, so the speed at lift-off isn't one noisy sample
+        self.velocity_x += (x_pixels / report_time - self.velocity_x) * 0.5
+        self.velocity_y += (y_pixels / report_time - self.velocity_y) * 0.5
+        return x_pixels, y_pixels
+
+class HidInput:
+    """Finds DualSense hidraw nodes, or recorded report files, and runs a HidReader for each.
+    The controller loop takes the readers' events instead of polling SDL."""
+
+    def __init__(self, report_dir=None, record_dir=None):
+        self.report_dir = report_dir
+        self.record_dir = record_dir
+        self.events = deque()
+        self.wakeup = Event()
+        self.readers = {}
+        self.opened = set()
+        self.failed = set()
+        self.next_instance_id = 0
+        self.stopped = Event()
+        self.thread = None
+
+    def get_events(self):
+        """Takes every event the readers produced since the last call"""
+        events = []
+        pending = self.events
+        while pending:
+            events.append(pending.popleft())
+        return events
+
+    def wait(self, timeout):
+        """Blocks until a reader has events or timeout seconds pass"""
+        self.wakeup.clear()
+        if not self.events:
+            self.wakeup.wait(timeout)
+
+    def scan(self):
+        """Returns (path, name, guid) for each controller that can be read"""
+        if self.report_dir:
+            return [(os.path.join(self.report_dir, file_name), f"Recorded controller ({file_name})", file_name)
+                    for file_name in sorted(os.listdir(self.report_dir)) if file_name.endswith('.bin')]
+        found = []
+        sys_dir = "/sys/class/hidraw"
+        for node in sorted(os.listdir(sys_dir)) if os.path.isdir(sys_dir) else ():
+            try:
+                with open(os.path.join(sys_dir, node, "device", "uevent")) as f:
+                    fields = dict(line.split('=', 1) for line in f.read().splitlines() if '=' in line)
+                bus, vendor, product = (int(part, 16) for part in fields['HID_ID'].split(':'))
+            except (OSError, KeyError, ValueError):
+                continue
+            if vendor == DUALSENSE_VENDOR_ID and product in DUALSENSE_PRODUCT_IDS:
+                # The serial (Bluetooth address) identifies the controller across reconnects
+                found.append((os.path.join("/dev", node), fields.get('HID_NAME', "DualSense"),
+                              fields.get('HID_UNIQ') or fields.get('HID_PHYS')))
+        return found
+
+    def open_new(self):
+        for path, name, guid in self.scan():
+            if path in self.opened or path in self.failed:
+                continue
+            reader = HidReader(path, self.next_instance_id, name, guid, self.events, self.reader_closed,
+                               recorded=bool(self.report_dir), record_dir=self.record_dir, wakeup=self.wakeup)
+            try:
+                reader.open()
+            except OSError as e:
+                # Usually a permission problem; a udev rule is needed to read hidraw nodes as a user
+                self.failed.add(path)
+                add_log(f"Cannot read {path}: {e}", level=WARNING)
+                continue
+            self.next_instance_id += 1
+            self.opened.add(path)
+            self.readers[reader.instance_id] = reader
+            # Queued before the reader runs, so the controller is registered before its first events
+            self.events.append(ReplayEvent(pygame.JOYDEVICEADDED, reader.instance_id))
+            self.wakeup.set()
+            reader.start()
+
+    def reader_closed(self, reader):
+        self.readers.pop(reader.instance_id, None)
+        # A recorded file is only played once; a hidraw node can be opened again when the controller returns
+        if not self.report_dir:
+            self.opened.discard(reader.path)
+
+    def run(self):
+        self.open_new()
+        while not self.stopped.wait(HID_RESCAN_INTERVAL):
+            self.open_new()
+
+    def start(self):
+        add_log(f"Reading DualSense reports from {self.report_dir or '/dev/hidraw*'}")
+        self.stopped.clear()
+        self.thread = Thread(target=self.run, name="HID discovery", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        for reader in list(self.readers.values()):
+            reader.stop()
+
+    def get_stats(self):
+        readers = list(self.readers.values())
+        return {'controllers': len(readers), 'reports': sum(reader.reports for reader in readers),
+                'crc_errors': sum(reader.crc_errors for reader in readers)}
+
+# Native report reader, set when INPUT_BACKEND is "hidraw"
+hid_input = None
+
+# Session log format: header, then one fixed-size record per joystick event
+SESSION_MAGIC = b"DSR1"
+SESSION_HEADER = struct.Struct('<4sd')  # magic, wall clock start time
+SESSION_RECORD = struct.Struct('<dBBBf')  # seconds since start, kind, instance id, axis/button, value
+SESSION_AXIS, SESSION_BUTTON_DOWN, SESSION_BUTTON_UP, SESSION_DEVICE_ADDED, SESSION_DEVICE_REMOVED = range(5)
+
+class ReplayEvent:
+    """Stand-in for a pygame joystick event, rebuilt from a session log or a HID report"""
+
+    __slots__ = ('type', 'instance_id', 'axis', 'button', 'value', 'device_index')
+
+    def __init__(self, type, instance_id=0, axis=0, button=0, value=0.0):
+        self.type = type
+        self.instance_id = instance_id
+        self.axis = axis
+        self.button = button
+        self.value = value
+        self.device_index = instance_id
+
+class SessionRecorder:
+    """Appends raw joystick events to a compact binary session log"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'wb', buffering=1 << 16)
+        self.start = time.perf_counter()
+        self.file.write(SESSION_HEADER.pack(SESSION_MAGIC, time.time()))
+        self.count = 0
+
+    def record(self, event):
+        if event.type == pygame.JOYAXISMOTION:
+            record = (SESSION_AXIS, event.axis, event.value)
+        elif event.type == pygame.JOYBUTTONDOWN:
+            record = (SESSION_BUTTON_DOWN, event.button, 1.0)
+        elif event.type == pygame.JOYBUTTONUP:
+            record = (SESSION_BUTTON_UP, event.button, 0.0)
+        elif event.type == pygame.JOYDEVICEADDED:
+            record = (SESSION_DEVICE_ADDED, 0, 0.0)
+        elif event.type == pygame.JOYDEVICEREMOVED:
+            record = (SESSION_DEVICE_REMOVED, 0, 0.0)
+        else:
             return
+        instance_id = getattr(event, 'instance_id', getattr(event, 'device_index', 0))
+        self.file.write(SESSION_RECORD.pack(time.perf_counter() - self.start, record[0],
+                                            instance_id & 0xff, record[1] & 0xff, record[2]))
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+        add_log(f"Recorded {self.count} events to {self.path}")
+
+def read_session(path):
+    """Reads a session log into a list of (timestamp, ReplayEvent)"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, started = SESSION_HEADER.unpack_from(data, 0)
+    if magic != SESSION_MAGIC:
+        raise ValueError(f"{path} is not a session log")
+
+    event_types = {
+        SESSION_AXIS: pygame.JOYAXISMOTION,
+        SESSION_BUTTON_DOWN: pygame.JOYBUTTONDOWN,
+        SESSION_BUTTON_UP: pygame.JOYBUTTONUP,
+        SESSION_DEVICE_ADDED: pygame.JOYDEVICEADDED,
+        SESSION_DEVICE_REMOVED: pygame.JOYDEVICEREMOVED
+    }
+    events = []
+    body = len(data) - SESSION_HEADER.size
+    for timestamp, kind, instance_id, index, value in SESSION_RECORD.iter_unpack(
+            data[SESSION_HEADER.size:SESSION_HEADER.size + body - body % SESSION_RECORD.size]):
+        events.append((timestamp, ReplayEvent(event_types[kind], instance_id, index, index, value)))
+    return events
+
+def replay_session(path, realtime=False, backend=None):
+    """Replays a session log through the controller processing with a simulated clock.
+    Returns the backend holding the output, stamped with simulated time."""
+    global output_backend, timer_wheel, mouse_emitter, selected_device
+    events = read_session(path)
+    clock = {'now': 0.0}
+    if backend is None:
+        backend = RecordingBackend(clock=lambda: clock['now'])
+    output_backend = backend
+    # Key pulses run on a wheel driven by the simulated clock instead of its own thread
+    timer_wheel = TimerWheel(clock=lambda: clock['now'])
+    wheel_ticks = 0
+
+    # Controllers are registered as their first event is replayed
+    devices.clear()
+    selected_device = None
+    emitter = MouseEmitter(backend)
+    mouse_emitter = emitter
+    emitter.emit(0.0)
+
+    tick = 1.0 / TICK_RATE
+    emit_period = 1.0 / min(MOUSE_EMIT_RATE, 1000)
+    next_emit = emit_period
+    end_time = events[-1][0] if events else 0.0
+    wall_start = time.perf_counter()
+    position = 0
+    ticks = 0
+
+    while clock['now'] <= end_time + tick:
+        ticks += 1
+        tick_end = ticks * tick
+        # Mouse emits falling inside this tick run at their own simulated times
+        while next_emit <= tick_end:
+            clock['now'] = next_emit
+            emitter.emit(next_emit)
+            next_emit += emit_period
+        while timer_wheel.pending and wheel_ticks < timer_wheel.tick_at(tick_end):
+            wheel_ticks += 1
+            clock['now'] = wheel_ticks * timer_wheel.resolution
+            timer_wheel.advance(clock['now'])
+        wheel_ticks = timer_wheel.tick_at(tick_end)
+        clock['now'] = tick_end
+        while position < len(events) and events[position][0] <= tick_end:
+            event = events[position][1]
+            position += 1
+            if event.type == pygame.JOYDEVICEREMOVED:
+                close_device(event.instance_id)
+                continue
+            if event.type == pygame.JOYDEVICEADDED:
+                continue
+            device = devices.get(event.instance_id)
+            if device is None:
+                device = register_device(event.instance_id, f"Replayed controller {event.instance_id}")
+            if process_event(event, device['state'], device['overlays']):
+                add_log(f"Emergency stop combo reached at {tick_end:.3f}s in replay")
+                backend.flush()
+                return backend
+        backend.flush()
+        if realtime:
+            delay = wall_start + tick_end - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    add_log(f"Replayed {len(events)} events from {path} over {ticks} ticks")
+    return backend
+
+# Session recorder, set when --record is given
+session_recorder = None
+
+# Time of the last controller input, and whether the loop is waiting for input instead of ticking
+last_input_time = time.perf_counter()
+idle = False
+waited_event = None  # SDL event that ended an idle wait, handled by the next tick
+# Only these count as input; window, audio and device events leave the loop idle. Native reports only
+# produce them when the controller's state changed.
+CONTROLLER_INPUT_EVENTS = frozenset((pygame.JOYAXISMOTION, pygame.JOYBUTTONDOWN, pygame.JOYBUTTONUP,
+                                     pygame.JOYHATMOTION))
+
+def wait_for_tick():
+    """Waits for the next tick. After IDLE_TIMEOUT without input, blocks until input arrives instead,
+    waking at least every IDLE_WAIT_TIMEOUT, and returns to the full tick rate with the first event."""
+    global idle, waited_event
+    if not IDLE_TIMEOUT or time.perf_counter() - last_input_time < IDLE_TIMEOUT:
+        if idle:
+            idle = False
+            tick_scheduler.reset()
+            add_log("Controller input received, back to the full tick rate", level=DEBUG)
+        tick_scheduler.wait()
+        return
+    if not idle:
+        idle = True
+        add_log(f"No controller input for {IDLE_TIMEOUT:g} s, waiting for input", level=DEBUG)
+    if hid_input:
+        hid_input.wait(IDLE_WAIT_TIMEOUT)
+    else:
+        event = pygame.event.wait(int(IDLE_WAIT_TIMEOUT * 1000))
+        if event.type != pygame.NOEVENT:
+            waited_event = event
+
+def run_tick():
+    """Routes every pending controller event to its device and emits the tick's output in one batch.
+    Returns False when the controller loop has to stop."""
+    global last_input_time, waited_event
+    started = time.perf_counter()
+    events = hid_input.get_events() if hid_input else pygame.event.get()
+    if waited_event:
+        events.insert(0, waited_event)
+        waited_event = None
+    polled = time.perf_counter()
+    poll_time.observe(polled - started)
+    events_per_tick.observe(len(events))
+    
+    if profile_watcher.ready:
+        apply_reloaded_profiles(profile_watcher.take())
+    if focus_watcher.changed:
+        # Cleared before the target is read, so a change made meanwhile is picked up next tick
+        focus_watcher.changed = False
+        apply_focus(focus_watcher.target, focus_watcher.title)
+    
+    for event in events:
+        if session_recorder:
+            session_recorder.record(event)
         
-        add_log("Joystick detected, initializing controller")
-        joystick = pygame.joystick.Joystick(0)
-        joystick.init()
-        
-        add_log(f"Controller name: {joystick.get_name()}")
-        if "DualSense" not in joystick.get_name():
-            add_log(f"Warning: Controller detected is not DualSense: {joystick.get_name()}")
-        
-        controller_status = f"Connected: {joystick.get_name()}"
+        if event.type == pygame.JOYDEVICEADDED:
+            try:
+                open_device(event.device_index)
+            except pygame.error as e:
+                # The device can vanish again before it is opened; its removal event follows
+                add_log(f"Could not open controller {event.device_index}: {e}", level=WARNING)
+        elif event.type == pygame.JOYDEVICEREMOVED:
+            # Releases the controller's held inputs and overlays at once; it is reopened when it comes back
+            close_device(event.instance_id)
+        else:
+            if event.type in CONTROLLER_INPUT_EVENTS:
+                last_input_time = started
+            device = devices.get(getattr(event, 'instance_id', None))
+            # While suspended, events are read only to keep the queue empty
+            if device and not suspended and process_event(event, device['state'], device['overlays']):
+                emergency_stop(root, f"Emergency stop combo activated (L1 + R1 + L2 + R2) on controller {device['player']}")
+                return False
+    
+    if reconnecting:
+        expire_reconnecting(time.perf_counter())
+    dispatch_time.observe(time.perf_counter() - polled)
+    
+    # Emit everything queued during this tick in one batch
+    output_backend.flush()
+    return True
+
+def handle_controller():
+    global running, EMERGENCY_STOP_COMBO, init_timeout, output_backend, mouse_emitter, controller_thread_id, hid_input
+    
+    controller_thread_id = get_ident()
+    try:
+        set_controller_status("Initializing DualSense controller...")
+        add_log("Starting controller initialization")
         
-        # Button mapping
-        BUTTON_X = 0
-        BUTTON_SQUARE = 2
-        BUTTON_TRIANGLE = 3
-        BUTTON_CIRCLE = 1
-        BUTTON_L1 = 9
-        BUTTON_R1 = 10
+        if output_backend is None:
+            output_backend = create_output_backend(OUTPUT_BACKEND)
+        output_backend.start()
         
-        # Trigger thresholds for emergency stop
-        L2_THRESHOLD = 0.5
-        R2_THRESHOLD = 0.5
+        if INPUT_BACKEND == "hidraw":
+            # SDL's joystick subsystem is not started, so it never opens the controllers as well
+            hid_input = HidInput(HID_REPORT_DIR, HID_RECORD_DIR)
+        else:
+            try:
+                add_log(f"Initializing pygame ({SDL_INIT_MODE} SDL init)")
+                init_pygame(SDL_INIT_MODE)
+                add_log("Pygame initialized successfully")
+            except Exception as e:
+                add_log(f"Pygame initialization error: {e}", level=ERROR)
+                set_controller_status(f"Error initializing pygame: {e}")
+                return
+            
+            try:
+                add_log("Initializing pygame joystick")
+                pygame.joystick.init()
+                add_log("Pygame joystick initialized successfully")
+            except Exception as e:
+                add_log(f"Pygame joystick initialization error: {e}", level=ERROR)
+                set_controller_status(f"Error initializing joystick: {e}")
+                return
         
-        # Emergency stop state
-        emergency_buttons = {
-            'L1': False,
-            'R1': False,
-            'L2': False,
-            'R2': False
-        }
+            add_log(f"Joystick count: {pygame.joystick.get_count()}")
         
-        # Key states
-        key_states = {
-            'w': False,
-            'a': False,
-            's': False,
-            'd': False
-        }
+        # Mouse motion runs on its own fixed-rate thread, summing every controller's stick
+        mouse_emitter = MouseEmitter(output_backend)
+        mouse_emitter.start()
+        timer_wheel.start()
+        if PROFILE_WATCH:
+            focus_paths = [path for path in FOCUS_WINDOWS.values() if path]
+            profile_watcher.start([active_profile_path] + list(DEVICE_PROFILES.values()) + focus_paths)
+        if FOCUS_WINDOWS:
+            focus_watcher.start()
         
-        # Mouse state
-        mouse_state = {
-            'x': 0.0,
-            'y': 0.0,
-            'target_x': 0.0,
-            'target_y': 0.0,
-            'last_update': time.time()
-        }
+        # Controllers connected now are opened here; later ones arrive as JOYDEVICEADDED events
+        if hid_input:
+            hid_input.start()
+        else:
+            for index in range(pygame.joystick.get_count()):
+                open_device(index)
+        update_device_status()
         
-        last_update = time.time()
+        if tick_scheduler.rate not in SUPPORTED_TICK_RATES:
+            add_log(f"Warning: tick rate {tick_scheduler.rate} Hz is not one of {SUPPORTED_TICK_RATES}", level=WARNING)
+        add_log(f"Starting controller loop at {tick_scheduler.rate} Hz with {len(devices)} controller(s)")
+        add_log(f"Mouse emitter running at {mouse_emitter.scheduler.rate} Hz")
+        if sample_profile_duration:
+            profiler.start(sample_profile_duration)
+        tick_scheduler.start()
         
         while running:
             try:
-                if not rate_limit_check():
-                    continue
+                wait_for_tick()
                 
-                current_time = time.time()
-                delta_time = current_time - last_update
-                last_update = current_time
-                
-                for event in pygame.event.get():
-                    # Check for emergency stop combo
-                    if event.type == pygame.JOYBUTTONDOWN:
-                        if event.button == BUTTON_L1:
-                            emergency_buttons['L1'] = True
-                        elif event.button == BUTTON_R1:
-                            emergency_buttons['R1'] = True
-                    
-                    elif event.type == pygame.JOYBUTTONUP:
-                        if event.button == BUTTON_L1:
-                            emergency_buttons['L1'] = False
-                        elif event.button == BUTTON_R1:
-                            emergency_buttons['R1'] = False
-                    
-                    elif event.type == pygame.JOYAXISMOTION:
-                        if event.axis == 4:  # L2
-                            emergency_buttons['L2'] = event.value > L2_THRESHOLD
-                        elif event.axis == 5:  # R2
-                            emergency_buttons['R2'] = event.value > R2_THRESHOLD
-                    
-                    # Check if all emergency buttons are pressed
-                    if all(emergency_buttons.values()):
-                        emergency_stop(root, "Emergency stop combo activated (L1 + R1 + L2 + R2)")
-                        return
-                    
-                    # Normal input handling
-                    if event.type == pygame.JOYAXISMOTION:
-                        # Left analog (axis 0 and 1)
-                        if event.axis == 0:  # X axis
-                            if abs(event.value) > STICK_DEADZONE:
-                                if event.value < 0 and not key_states['a']:
-                                    pyautogui.keyDown('a')
-                                    key_states['a'] = True
-                                    canvas.after(1, lambda: update_button_state(canvas, "stick_left", True))
-                                elif event.value > 0 and not key_states['d']:
-                                    pyautogui.keyDown('d')
-                                    key_states['d'] = True
-                                    canvas.after(1, lambda: update_button_state(canvas, "stick_left", True))
-                            else:
-                                if key_states['a']:
-                                    pyautogui.keyUp('a')
-                                    key_states['a'] = False
-                                if key_states['d']:
-                                    pyautogui.keyUp('d')
-                                    key_states['d'] = False
-                                canvas.after(1, lambda: update_button_state(canvas, "stick_left", False))
-                        
-                        elif event.axis == 1:  # Y axis
-                            if abs(event.value) > STICK_DEADZONE:
-                                if event.value < 0 and not key_states['w']:
-                                    pyautogui.keyDown('w')
-                                    key_states['w'] = True
-                                    canvas.after(1, lambda: update_button_state(canvas, "stick_left", True))
-                                elif event.value > 0 and not key_states['s']:
-                                    pyautogui.keyDown('s')
-                                    key_states['s'] = True
-                                    canvas.after(1, lambda: update_button_state(canvas, "stick_left", True))
-                            else:
-                                if key_states['w']:
-                                    pyautogui.keyUp('w')
-                                    key_states['w'] = False
-                                if key_states['s']:
-                                    pyautogui.keyUp('s')
-                                    key_states['s'] = False
-                                canvas.after(1, lambda: update_button_state(canvas, "stick_left", False))
-                        
-                        # Right analog (axis 2 and 3)
-                        elif event.axis == 2:  # Right X axis
-                            if abs(event.value) > STICK_DEADZONE:
-                                mouse_state['x'] = event.value * STICK_SENSITIVITY
-                                canvas.after(1, lambda: update_button_state(canvas, "stick_right", True))
-                            else:
-                                mouse_state['x'] = 0.0
-                                canvas.after(1, lambda: update_button_state(canvas, "stick_right", False))
-                        
-                        elif event.axis == 3:  # Right Y axis
-                            if abs(event.value) > STICK_DEADZONE:
-                                mouse_state['y'] = event.value * STICK_SENSITIVITY
-                                canvas.after(1, lambda: update_button_state(canvas, "stick_right", True))
-                            else:
-                                mouse_state['y'] = 0.0
-                                canvas.after(1, lambda: update_button_state(canvas, "stick_right", False))
-                        
-                        # Triggers (axis 4 and 5)
-                        elif event.axis == 4:  # L2
-                            if event.value > 0.5:
-                                pyautogui.press('e')
-                                canvas.after(1, lambda: update_button_state(canvas, "button_l2", True))
-                            else:
-                                canvas.after(1, lambda: update_button_state(canvas, "button_l2", False))
-                        elif event.axis == 5:  # R2
-                            if event.value > 0.5:
-                                canvas.after(1, lambda: update_button_state(canvas, "button_r2", True))
-                                pyautogui.mouseDown(button='left')
-                            else:
-                                canvas.after(1, lambda: update_button_state(canvas, "button_r2", False))
-                                pyautogui.mouseUp(button='left')
-                    
-                    elif event.type == pygame.JOYBUTTONDOWN:
-                        if event.button == BUTTON_X:
-                            pyautogui.press('3')
-                            canvas.after(1, lambda: update_button_state(canvas, "button_x", True))
-                        elif event.button == BUTTON_SQUARE:
-                            pyautogui.press('2')
-                            canvas.after(1, lambda: update_button_state(canvas, "button_square", True))
-                        elif event.button == BUTTON_TRIANGLE:
-                            pyautogui.press('1')
-                            canvas.after(1, lambda: update_button_state(canvas, "button_triangle", True))
-                        elif event.button == BUTTON_CIRCLE:
-                            pyautogui.press('4')
-                            canvas.after(1, lambda: update_button_state(canvas, "button_circle", True))
-                        elif event.button == BUTTON_L1:
-                            pyautogui.press('enter')
-                            canvas.after(1, lambda: update_button_state(canvas, "button_l1", True))
-                        elif event.button == BUTTON_R1:
-                            canvas.after(1, lambda: update_button_state(canvas, "button_r1", True))
-                        # D-Pad handlers
-                        elif event.button == 11:  # D-Pad Up
-                            pyautogui.press('i')
-                            canvas.after(1, lambda: update_button_state(canvas, "dpad_up", True))
-                        elif event.button == 12:  # D-Pad Down
-                            pyautogui.press('c')
-                            canvas.after(1, lambda: update_button_state(canvas, "dpad_down", True))
-                        elif event.button == 13:  # D-Pad Left
-                            pyautogui.press('r')
-                            canvas.after(1, lambda: update_button_state(canvas, "dpad_left", True))
-                        elif event.button == 14:  # D-Pad Right
-                            pyautogui.press('m')
-                            canvas.after(1, lambda: update_button_state(canvas, "dpad_right", True))
-                    
-                    elif event.type == pygame.JOYBUTTONUP:
-                        if event.button == BUTTON_X:
-                            canvas.after(1, lambda: update_button_state(canvas, "button_x", False))
-                        elif event.button == BUTTON_SQUARE:
-                            canvas.after(1, lambda: update_button_state(canvas, "button_square", False))
-                        elif event.button == BUTTON_TRIANGLE:
-                            canvas.after(1, lambda: update_button_state(canvas, "button_triangle", False))
-                        elif event.button == BUTTON_CIRCLE:
-                            canvas.after(1, lambda: update_button_state(canvas, "button_circle", False))
-                        elif event.button == BUTTON_L1:
-                            canvas.after(1, lambda: update_button_state(canvas, "button_l1", False))
-                        elif event.button == BUTTON_R1:
-                            canvas.after(1, lambda: update_button_state(canvas, "button_r1", False))
-                        elif event.button == 11:  # D-Pad Up
-                            canvas.after(1, lambda: update_button_state(canvas, "dpad_up", False))
-                        elif event.button == 12:  # D-Pad Down
-                            canvas.after(1, lambda: update_button_state(canvas, "dpad_down", False))
-                        elif event.button == 13:  # D-Pad Left
-                            canvas.after(1, lambda: update_button_state(canvas, "dpad_left", False))
-                        elif event.button == 14:  # D-Pad Right
-                            canvas.after(1, lambda: update_button_state(canvas, "dpad_right", False))
-                    
-                    elif event.type == pygame.JOYDEVICEREMOVED:
-                        controller_status = "Controller disconnected. Reconnecting..."
-                        # Release all keys before reconnecting
-                        for key in key_states:
-                            if key_states[key]:
-                                pyautogui.keyUp(key)
-                                key_states[key] = False
-                        
-                        # Reset all button overlays
-                        for tag in button_overlays:
-                            canvas.after(1, lambda t=tag: update_button_state(canvas, t, False))
-                        
-                        pygame.joystick.quit()
-                        pygame.joystick.init()
-                        while pygame.joystick.get_count() == 0 and running:
-                            time.sleep(1)
-                        if running:
-                            joystick = pygame.joystick.Joystick(0)
-                            joystick.init()
-                            if "DualSense" not in joystick.get_name():
-                                emergency_stop(root, "Unsupported controller detected after reconnection")
-                                return
-                            controller_status = "Controller reconnected!"
-                
-                # Mouse movement with validation and smoothing
-                if abs(mouse_state['x']) > MOUSE_MIN_MOVE or abs(mouse_state['y']) > MOUSE_MIN_MOVE:
-                    # Apply acceleration and sensitivity
-                    x_move = apply_mouse_acceleration(mouse_state['x']) * MOUSE_SENSITIVITY
-                    y_move = apply_mouse_acceleration(mouse_state['y']) * MOUSE_SENSITIVITY
-                    
-                    # Validate movement
-                    x_move, y_move = validate_mouse_movement(x_move, y_move)
-                    
-                    # Apply time-based smoothing
-                    x_move *= delta_time * 60  # Normalize to 60 FPS
-                    y_move *= delta_time * 60
-                    
-                    # Move mouse
-                    try:
-                        pyautogui.moveRel(int(x_move), int(y_move))
-                    except ValueError:
-                        pass  # Ignore invalid movements
-                
-                time.sleep(0.001)  # Small sleep to prevent CPU overuse
+                if not run_tick():
+                    return
                 
             except Exception as e:
-                controller_status = f"Error: {e}"
+                set_controller_status(f"Error: {e}")
                 time.sleep(1)
+        
+        tick_scheduler.stop()
+        mouse_emitter.stop()
+        timer_wheel.stop()
+        profile_watcher.stop()
+        focus_watcher.stop()
+        if hid_input:
+            hid_input.stop()
+        for device in list(devices.values()):
+            release_held_inputs(device['state'])
+        output_backend.flush()
+        output_backend.stop()
+        if session_recorder:
+            session_recorder.close()
                 
     except Exception as e:
-        add_log(f"Critical error in handle_controller: {e}")
+        add_log(f"Critical error in handle_controller: {e}", level=ERROR)
         emergency_stop(root, f"Critical error: {e}")
 
+def run_replay(args):
+    """Replays a session log and prints a summary of the output it produced"""
+    backend = replay_session(args.replay, realtime=args.replay_speed == 'realtime')
+    counts = {}
+    moved_x = 0
+    moved_y = 0
+    for timestamp, event in backend.events:
+        counts[event[0]] = counts.get(event[0], 0) + 1
+        if event[0] == 'move':
+            moved_x += event[1]
+            moved_y += event[2]
+
+    print(f"Output events: {len(backend.events)}")
+    for kind, count in sorted(counts.items()):
+        print(f"  {kind}: {count}")
+    print(f"Total mouse motion: x={moved_x} y={moved_y}")
+
+    if args.replay_output:
+        with open(args.replay_output, 'w') as f:
+            for timestamp, event in backend.events:
+                f.write(f"{timestamp:.6f} {' '.join(str(part) for part in event)}\n")
+        print(f"Output written to {args.replay_output}")
+    return 0
+
+def run_headless():
+    """Runs the controller loop on the main thread without Tk, PIL or the controller image"""
+    global running
+    add_log("Running headless, emergency stop: L1 + R1 + L2 + R2 or Ctrl+C")
+    try:
+        handle_controller()
+    except KeyboardInterrupt:
+        add_log("Interrupted, releasing held inputs")
+        running = False
+        release_all_outputs()
+
+def run_gui():
+    """Builds the status window and runs the controller loop on a background thread"""
+    global root
+    import tkinter as tk
+    from tkinter import ttk
+    
+    root, canvas = create_status_window()
+    
+    # Add debug button to main window
+    debug_button_style = {
+        'background': '#555555',
+        'foreground': '#ffffff',
+        'activebackground': '#777777',
+        'activeforeground': '#ffffff',
+        'relief': 'raised',
+        'borderwidth': 2,
+        'padx': 10,
+        'pady': 3,
+        'font': ('Arial', 8)
+    }
+    
+    debug_frame = ttk.Frame(root)
+    debug_frame.pack(side=tk.BOTTOM, fill=tk.X, pady=5)
+    debug_button = tk.Button(debug_frame, text="Debug Info", command=show_debug_info, **debug_button_style)
+    debug_button.pack(side=tk.RIGHT, padx=10)
+    
+    def toggle_profiler():
+        """Profiles the controller loop for PROFILER_DEFAULT_DURATION seconds"""
+        if profiler.start(PROFILER_DEFAULT_DURATION):
+            profile_button.config(text="Profiling...", state='disabled')
+            root.after(int(PROFILER_DEFAULT_DURATION * 1000) + 500, wait_for_profiler)
+    
+    def wait_for_profiler():
+        if profiler.active:
+            root.after(200, wait_for_profiler)
+        else:
+            profile_button.config(text=f"Profile {PROFILER_DEFAULT_DURATION} s", state='normal')
+    
+    profile_button = tk.Button(debug_frame, text=f"Profile {PROFILER_DEFAULT_DURATION} s", command=toggle_profiler,
+                               **debug_button_style)
+    profile_button.pack(side=tk.RIGHT)
+    
+    show_security_warning()
+    add_log("Starting controller thread")
+    controller_thread = Thread(target=handle_controller, name="Controller")
+    controller_thread.daemon = True
+    controller_thread.start()
+    add_log("Main GUI loop starting")
+    root.mainloop()
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="DualSense PS5 Controller Mapper for Runiverse")
+    parser.add_argument('--headless', action='store_true',
+                        help="run without the window, reporting status to the console/log")
+    parser.add_argument('--profile', metavar='PATH', help=f"mapping profile to load (default: {PROFILE_PATH})")
+    parser.add_argument('--no-watch', action='store_true', help="don't reload profiles when their files change")
+    parser.add_argument('--focus-window', action='append', metavar='TEXT[=PATH]',
+                        help="only send input while a window whose title or class contains TEXT has focus, "
+                             "optionally with its own profile (repeatable, replaces the default 'Runiverse')")
+    parser.add_argument('--any-window', action='store_true', help="send input to whichever window has focus")
+    parser.add_argument('--device-profile', action='append', default=[], metavar='PLAYER=PATH',
+                        help="profile for one controller, numbered in connection order (repeatable)")
+    parser.add_argument('--tick-rate', type=int, choices=SUPPORTED_TICK_RATES, default=TICK_RATE,
+                        help=f"controller loop rate in Hz (default: {TICK_RATE})")
+    parser.add_argument('--idle-timeout', type=float, default=IDLE_TIMEOUT, metavar='SECONDS',
+                        help=f"stop ticking after SECONDS without controller input until input arrives, 0 to never idle "
+                             f"(default: {IDLE_TIMEOUT:g})")
+    parser.add_argument('--input', choices=('sdl', 'hidraw'), default=INPUT_BACKEND,
+                        help=f"read controllers through SDL or from DualSense hidraw reports on Linux (default: {INPUT_BACKEND})")
+    parser.add_argument('--hid-reports', metavar='DIR', help="read recorded raw reports (*.bin) from DIR instead of /dev/hidraw*")
+    parser.add_argument('--hid-record', metavar='DIR', help="also write each controller's raw reports to DIR")
+    parser.add_argument('--backend', choices=['auto'] + list(OUTPUT_BACKENDS), default=OUTPUT_BACKEND,
+                        help=f"keyboard/mouse output backend (default: {OUTPUT_BACKEND})")
+    parser.add_argument('--sdl-init', choices=('selective', 'full'), default=SDL_INIT_MODE,
+                        help=f"start only the SDL subsystems needed for controllers, or all of pygame (default: {SDL_INIT_MODE})")
+    parser.add_argument('--metrics-port', type=int, metavar='PORT',
+                        help=f"serve Prometheus metrics on http://{METRICS_HOST}:PORT/metrics")
+    parser.add_argument('--metrics-socket', metavar='PATH', help="serve Prometheus metrics over HTTP on a Unix socket")
+    parser.add_argument('--sample-profile', type=float, metavar='SECONDS',
+                        help="sample the controller threads for SECONDS once the loop starts and write a profile")
+    parser.add_argument('--log-file', metavar='PATH', help="write the log to this file instead of the per-user log directory")
+    parser.add_argument('--log-level', choices=('debug', 'info', 'warning', 'error'), default='info',
+                        help="lowest level that is logged (default: info)")
+    parser.add_argument('--record', metavar='PATH', help="record raw controller events to a session log")
+    parser.add_argument('--replay', metavar='PATH', help="replay a session log without a controller and exit")
+    parser.add_argument('--replay-speed', choices=('fast', 'realtime'), default='fast',
+                        help="replay as fast as possible or at the original speed (default: fast)")
+    parser.add_argument('--replay-output', metavar='PATH', help="write the replayed output events to a text file")
+    return parser.parse_args()
+
 if __name__ == "__main__":
+    args = parse_arguments()
+    logger.level = {'debug': DEBUG, 'info': INFO, 'warning': WARNING, 'error': ERROR}[args.log_level]
+    logger.start(args.log_file or LOG_FILE)
     try:
         add_log("Program starting")
-        root, canvas = create_status_window()
-        
-        # Add debug button to main window
-        debug_button_style = {
-            'background': '#555555',
-            'foreground': '#ffffff',
-            'activebackground': '#777777',
-            'activeforeground': '#ffffff',
-            'relief': 'raised',
-            'borderwidth': 2,
-            'padx': 10,
-            'pady': 3,
-            'font': ('Arial', 8)
-        }
-        
-        debug_frame = ttk.Frame(root)
-        debug_frame.pack(side=tk.BOTTOM, fill=tk.X, pady=5)
-        debug_button = tk.Button(debug_frame, text="Debug Info", command=show_debug_info, **debug_button_style)
-        debug_button.pack(side=tk.RIGHT, padx=10)
-        
-        show_security_warning()
-        add_log("Starting controller thread")
-        controller_thread = Thread(target=handle_controller, args=(canvas,))
-        controller_thread.daemon = True
-        controller_thread.start()
-        add_log("Main GUI loop starting")
-        root.mainloop()
+        if args.profile:
+            active_profile_path = args.profile
+            active_profile = load_active_profile(args.profile)
+        PROFILE_WATCH = not args.no_watch
+        if args.focus_window:
+            FOCUS_WINDOWS = {}
+            for rule in args.focus_window:
+                text, _, path = rule.partition('=')
+                FOCUS_WINDOWS[text] = path or None
+        if args.any_window:
+            FOCUS_WINDOWS = {}
+        # Compiled now so a focus change never reads a file on the controller loop
+        for path in FOCUS_WINDOWS.values():
+            if path and os.path.abspath(path) != os.path.abspath(active_profile_path):
+                device_profile_cache[os.path.abspath(path)] = load_active_profile(path)
+        for assignment in args.device_profile:
+            player, _, path = assignment.partition('=')
+            if not player.isdigit() or not path:
+                raise ValueError(f"--device-profile expects PLAYER=PATH, got {assignment}")
+            DEVICE_PROFILES[int(player)] = path
+            # A bad path stops the program here instead of when the controller connects
+            if not os.path.exists(path):
+                raise ValueError(f"Profile {path} for controller {player} not found")
+            if os.path.abspath(path) != os.path.abspath(active_profile_path):
+                try:
+                    device_profile_cache[os.path.abspath(path)] = compile_profile(load_profile(path))
+                except (OSError, ValueError, KeyError, TypeError) as e:
+                    raise ValueError(f"Invalid profile {path} for controller {player}: {e}")
+        TICK_RATE = args.tick_rate
+        tick_scheduler.set_rate(TICK_RATE)
+        IDLE_TIMEOUT = args.idle_timeout
+        OUTPUT_BACKEND = args.backend
+        SDL_INIT_MODE = args.sdl_init
+        INPUT_BACKEND = "hidraw" if args.hid_reports else args.input
+        HID_REPORT_DIR = args.hid_reports
+        HID_RECORD_DIR = args.hid_record
+        if args.replay:
+            sys.exit(run_replay(args))
+        sample_profile_duration = args.sample_profile
+        if args.metrics_port or args.metrics_socket:
+            start_metrics_server(args.metrics_port, args.metrics_socket)
+        if args.record:
+            session_recorder = SessionRecorder(args.record)
+            add_log(f"Recording controller events to {args.record}")
+        if args.headless:
+            run_headless()
+        else:
+            run_gui()
     except Exception as e:
-        add_log(f"Critical error in main: {e}")
+        add_log(f"Critical error in main: {e}", level=ERROR)
         print(f"Critical error: {e}")
     finally:
         add_log("Program shutdown")
+        logger.stop()
         pygame.quit()
-        sys.exit(0)
\ No newline at end of file
+        sys.exit(0)